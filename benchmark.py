@@ -0,0 +1,573 @@
+import time
+import tempfile
+from pathlib import Path
+from threading import Thread
+from contextlib import contextmanager
+from urllib.request import urlopen
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+# post pages(*.html and *.links.txt of `Instagram.record_fixture`) checked in for `parser` and `carousel`
+FIXTURES_PATH = Path(__file__).parent / "fixtures"
+
+# Local stand-in server
+def make_jpeg(path: Path, size=(640, 640), seed=0):
+    from PIL import Image
+    import random
+
+    rnd = random.Random(seed)
+    img = Image.new("RGB", size)
+    pixels = [(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)) for _ in range(size[0]*size[1])]
+    img.putdata(pixels)
+    img.save(path, format="JPEG", quality=90)
+
+def make_fixtures(path: Path, n_imgs: int=20):
+    for i in range(n_imgs):
+        make_jpeg(path / f"{i}.jpg", seed=i)
+
+def make_post_html(base_url: str, user_id: str="spider_user", n_imgs: int=3, n_filler: int=3000,
+        shortcode: str="xxx", embed_data: bool=True) -> str:
+    r"""synthetic post page that has the same classes as `Instagram.ATTRS_*`,
+    `n_filler` unrelated elements make the page as bulky as a real one
+    """
+    import json
+    from src.insta import Instagram as I
+
+    media = {"shortcode": shortcode, "edge_sidecar_to_children": {"edges": [
+        {"node": {"is_video": False, "display_url": f"{base_url}/{i}.jpg"}} for i in range(n_imgs)
+    ]}}
+    data = json.dumps({"graphql": {"shortcode_media": media}})
+    script = f"<script>window.__additionalDataLoaded('/p/{shortcode}/',{data});</script>" if embed_data else ""
+
+    slides = "".join(
+        f'<li class="{I.ATTRS_POST_LIST}"><div><img class="{I.ATTRS_IMG}" src="{base_url}/{i}.jpg"></div></li>'
+        for i in range(n_imgs)
+    )
+    filler = "".join(f'<div class="x{i}"><span>filler {i}</span><a href="/x/{i}/">link</a></div>' for i in range(n_filler))
+    return f"""<html><head><title>post</title></head><body><div id="react-root"><section><main><div><div><article>
+<header><div class="{I.ATTRS_USER_ID}"><a href="/{user_id}/">{user_id}</a></div></header>
+<div><div><ul>{slides}</ul></div></div>
+<div><ul>
+<div class="{I.ATTRS_POST_TEXT}"><h2><a href="/{user_id}/">{user_id}</a></h2><span>delicious lunch <a class="{I.ATTRS_TAGS}" href="/explore/tags/food/">#food</a> <a class="{I.ATTRS_TAGS}" href="/explore/tags/lunch/">#lunch</a></span><div>1h</div></div>
+<div class="{I.ATTRS_POST_TEXT}"><h3><a href="/other/">other</a></h3><span>nice!</span><div>1h</div></div>
+</ul></div>
+<section><div class="{I.ATTRS_LIKES}"><button>좋아요 <span>1,234</span>개</button></div></section>
+<div class="{I.ATTRS_DATE}"><a href="/p/xxx/"><time datetime="2021-03-01T12:00:00.000Z">March 1</time></a></div>
+</article></div></div>{filler}</main></section></div>{script}</body></html>"""
+
+@contextmanager
+def serve_fixtures(path: Path, delay: float=0.0):
+    """serve files under `path` from a local http server, yields the base url
+
+    Args:
+        path (Path): fixture directory
+        delay (float, optional): latency(seconds) added to every response. Defaults to 0.0.
+    """
+    class Handler(SimpleHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(path), **kwargs)
+
+        def do_GET(self):
+            if delay:
+                time.sleep(delay)
+            super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+# Benchmarks
+def bench_download(n_imgs: int, delay: float):
+    from src.downloader import ImageDownloader
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        make_fixtures(tmp, n_imgs)
+        with serve_fixtures(tmp, delay) as base_url:
+            urls = [f"{base_url}/{i}.jpg" for i in range(n_imgs)]
+
+            start = time.perf_counter()
+            serial = []
+            for url in urls:
+                with urlopen(url) as img_reader:
+                    serial.append(img_reader.read())
+            serial_time = time.perf_counter() - start
+
+            downloader = ImageDownloader()
+            start = time.perf_counter()
+            futures = [downloader.submit(url) for url in urls]
+            pooled = [f.result() for f in futures]
+            pooled_time = time.perf_counter() - start
+            downloader.close()
+
+    assert serial == pooled, "downloaded bytes are different"
+    print(f"[INFO] urlopen(serial): {serial_time:.3f}s / {n_imgs/serial_time:.1f} imgs/s")
+    print(f"[INFO] ImageDownloader(pooled): {pooled_time:.3f}s / {n_imgs/pooled_time:.1f} imgs/s")
+
+def bench_parser(fixtures_path: str, repeat: int):
+    import tracemalloc
+    from src.insta import Instagram
+    from src.parser import PostParser
+
+    if fixtures_path is None:
+        pages = {"synthetic": make_post_html("http://127.0.0.1")}
+    else:
+        # post pages saved from `driver.page_source`
+        pages = {p.name: p.read_text(encoding="utf-8") for p in sorted(Path(fixtures_path).glob("*.html"))}
+    parse_fields = lambda soup: Instagram.parse_post_info(soup) + (Instagram.get_img(soup, 0), ) \
+        + Instagram.parse_post_text(soup, Instagram.parse_post_info(soup)[0])
+
+    backends = [("full html.parser", PostParser("html.parser"))]
+    for backend in PostParser.BACKENDS:
+        try:
+            backends.append((backend, PostParser(backend, Instagram.PARSE_CLASSES)))
+        except ImportError:
+            print(f"[INFO] Skip {backend}: not installed")
+
+    expected = {name: parse_fields(backends[0][1].parse(html)) for name, html in pages.items()}
+    for backend_name, parser in backends:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for name, html in pages.items():
+                assert parse_fields(parser.parse(html)) == expected[name], f"{backend_name}: fields are different in {name}"
+        per_page = (time.perf_counter() - start) / (repeat * len(pages))
+        tracemalloc.start()
+        for html in pages.values():
+            parser.parse(html)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"[INFO] {backend_name:>16}: {per_page*1000:.2f}ms per page / peak memory {peak/2**20:.2f}MB")
+
+def check_carousel(fixtures_path: str):
+    r"""compare `Instagram.get_carousel_links` with the links recorded by `Instagram.record_fixture`"""
+    from src.insta import Instagram
+
+    if fixtures_path is None:
+        html = make_post_html("http://127.0.0.1", n_imgs=5)
+        fixtures = {"synthetic": (html, [f"http://127.0.0.1/{i}.jpg" for i in range(5)])}
+    else:
+        fixtures = {}
+        for p in sorted(Path(fixtures_path).glob("*.links.txt")):
+            html_path = p.with_name(p.name[:-len(".links.txt")] + ".html")
+            links = [x.strip() for x in p.read_text(encoding="utf-8").splitlines() if x.strip()]
+            fixtures[html_path.name] = (html_path.read_text(encoding="utf-8"), links)
+    n_failed = 0
+    for name, (html, links) in fixtures.items():
+        start = time.perf_counter()
+        img_links = Instagram.get_carousel_links(html)
+        elapsed = (time.perf_counter() - start) * 1000
+        if img_links is None:
+            status = "no embedded data, fallback to click"
+        elif img_links == links:
+            status = "ok"
+        else:
+            status = "different"
+            n_failed += 1
+        print(f"[INFO] {name}: {status} ({len(links)} slides, {elapsed:.2f}ms)")
+    if n_failed:
+        raise Exception(f"[Error] {n_failed} fixtures are different")
+
+def check_parquet():
+    r"""export rows built like `Spider.get_data`(user name in `uid`) and numeric uids of old rows with
+    `Spider.export_parquet`, and compare the columns read back"""
+    import yaml
+    import shutil
+    import pyarrow.dataset as ds
+    from src.wrapper import Spider
+
+    db_name = "check_parquet.db"
+    db_path = Path("./database") / db_name
+    for suffix in ["", "-wal", "-shm"]:
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    work_path = Path(tempfile.mkdtemp())
+    settings = {
+        "insta_settings": {},
+        "db_settings": {"db_name": db_name, "table_name": "parquet_check"},
+        "spider_settings": {"recreate": False, "only_extract": True, "stage": 0, "img_fmt": ".jpg",
+            "output_path": str(work_path / "output")},
+    }
+    settings_path = work_path / "settings.yaml"
+    settings_path.write_text(yaml.safe_dump(settings), encoding="utf-8")
+    sp = Spider(str(settings_path))
+    uids = ["someuser", "user.name_1", 12345]
+    sp.db.ingest([[None, "check", f"/p/{i}/", "post #check", [b"img"], "#check", uid, "2021-01-01", 10]
+        for i, uid in enumerate(uids)])
+    sp.db.close()
+    sp.export_parquet(tags="check")
+    table = ds.dataset(work_path / "output" / "parquet", partitioning="hive").to_table()
+    shutil.rmtree(work_path)
+    for suffix in ["", "-wal", "-shm"]:
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    if table.column("uid").to_pylist() != [str(uid) for uid in uids]:
+        raise Exception(f"[Error] uid is different: {table.column('uid').to_pylist()}")
+    print(f"[INFO] parquet: ok ({table.num_rows} rows, uid {table.schema.field('uid').type})")
+
+def bench_fetch(n_posts: int, n_imgs: int, delay: float, backend: str, driver_path: str):
+    from src.insta import Instagram, PostFetcher
+    from src.parser import PostParser
+    from src.downloader import ImageDownloader
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        make_fixtures(tmp, n_imgs)
+        with serve_fixtures(tmp, delay) as base_url:
+            links = []
+            for i in range(n_posts):
+                post_path = tmp / "p" / f"{i}"
+                post_path.mkdir(parents=True)
+                html = make_post_html(base_url, n_imgs=n_imgs, shortcode=f"{i}")
+                (post_path / "index.html").write_text(html, encoding="utf-8")
+                links.append(f"/p/{i}/")
+
+            parser = PostParser(backend, Instagram.PARSE_CLASSES)
+            downloader = ImageDownloader()
+            fetcher = PostFetcher(downloader, parser, base_url)
+            start, cpu_start = time.perf_counter(), time.process_time()
+            for link in links:
+                data = fetcher.fetch(link)
+                assert data is not None, f"failed to parse {link}"
+                [f.result() for f in data[2]]
+            elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+            downloader.close()
+            print(f"[INFO] http: {elapsed/n_posts*1000:.1f}ms latency / {cpu/n_posts*1000:.1f}ms cpu per post")
+
+            if driver_path is None:
+                return
+            from selenium import webdriver
+
+            options = webdriver.ChromeOptions()
+            options.add_argument("--headless")
+            driver = webdriver.Chrome(driver_path, options=options)
+            downloader = ImageDownloader()
+            start, cpu_start = time.perf_counter(), time.process_time()
+            for link in links:
+                driver.get(f"{base_url}{link}")
+                webpage = driver.page_source
+                soup = parser.parse(webpage)
+                Instagram.parse_post_info(soup)
+                img_links = Instagram.get_carousel_links(webpage, link)
+                [downloader.fetch(img_link) for img_link in img_links]
+            elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+            driver.close()
+            downloader.close()
+            # cpu time of chrome itself is not included
+            print(f"[INFO] browser: {elapsed/n_posts*1000:.1f}ms latency / {cpu/n_posts*1000:.1f}ms cpu per post(python only)")
+
+# sqlite profiles of `db_settings`
+SQLITE_PROFILES = {
+    "default": {},
+    "wal": {"journal_mode": "WAL", "synchronous": "NORMAL"},
+    "wal_tuned": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -65536,
+        "page_size": 16384, "mmap_size": 268435456, "wal_autocheckpoint": 1000},
+    "wal_nosync": {"journal_mode": "WAL", "synchronous": "OFF", "cache_size": -65536},
+}
+
+def bench_sqlite(n_rows: int, img_kb: int, insert_freq: int, profiles: list):
+    r"""rows/s and MB/s of inserting posts with BLOB images under each profile,
+    while a labeler-like reader reads the same file from another connection
+    """
+    import os
+    import random
+    import sqlite3
+    from src.database import Database
+
+    profiles = profiles or list(SQLITE_PROFILES)
+    rnd = random.Random(0)
+    for profile in profiles:
+        db_name = f"bench_{profile}.db"
+        db_path = Path("./database") / db_name
+        for suffix in ["", "-wal", "-shm"]:
+            Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+        kwargs = {"db_name": db_name, "table_name": "bench", **SQLITE_PROFILES[profile]}
+        db = Database(**kwargs)
+
+        stop = False
+        reads = {"ok": 0, "locked": 0, "max_latency": 0.0}
+        def read_loop():
+            reader = Database(**{**kwargs, "checkpoint_on_close": None})
+            while not stop:
+                read_start = time.perf_counter()
+                try:
+                    ids = reader.get_ids("bench")
+                    if ids:
+                        reader.get_post(ids[-1])
+                        reader.get_images(ids[-1])
+                    reads["ok"] += 1
+                except sqlite3.OperationalError:
+                    reads["locked"] += 1
+                reads["max_latency"] = max(reads["max_latency"], time.perf_counter() - read_start)
+                time.sleep(0.001)
+            reader.close()
+        reader = Thread(target=read_loop, daemon=True)
+        reader.start()
+
+        n_bytes = 0
+        start = time.perf_counter()
+        for i in range(0, n_rows, insert_freq):
+            batch = []
+            for idx in range(i, min(i + insert_freq, n_rows)):
+                imgs = [rnd.randbytes(img_kb * 1024) for _ in range(3)]
+                n_bytes += sum(len(img) for img in imgs)
+                batch.append([idx, "bench", f"/p/{idx}/", "post", imgs, "", idx, "2021-01-01", 0])
+            db.insert(batch)
+            db.commit()
+        elapsed = time.perf_counter() - start
+        stop = True
+        reader.join()
+        db.close()
+        size = sum(Path(f"{db_path}{suffix}").stat().st_size for suffix in ["", "-wal"] if Path(f"{db_path}{suffix}").exists())
+        print(f"[INFO] {profile}: {n_rows/elapsed:.1f} rows/s, {n_bytes/2**20/elapsed:.1f} MB/s, "
+            f"reader {reads['ok']} reads / {reads['locked']} locked / {reads['max_latency']*1000:.0f}ms max latency, file {size/2**20:.1f}MB")
+        for suffix in ["", "-wal", "-shm"]:
+            Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
+def _ingest_worker(kwargs: dict, worker: int, n_rows: int, img_kb: int, insert_freq: int) -> list:
+    import random
+    from src.database import Database
+
+    rnd = random.Random(worker)
+    db = Database(**kwargs)
+    ids = []
+    for i in range(0, n_rows, insert_freq):
+        batch = [[None, f"tag{worker}", f"/p/{worker}_{idx}/", "post", [rnd.randbytes(img_kb * 1024)],
+            "", idx, "2021-01-01", 0] for idx in range(i, min(i + insert_freq, n_rows))]
+        ids.extend(db.ingest(batch))
+    db.close()
+    return ids
+
+def bench_ingest(n_workers: int, n_rows: int, img_kb: int, insert_freq: int, profile: str):
+    r"""spider processes ingest into one database at once, check that no ids collide and no rows are lost"""
+    from concurrent.futures import ProcessPoolExecutor
+    from src.database import Database
+
+    db_name = "bench_ingest.db"
+    db_path = Path("./database") / db_name
+    for suffix in ["", "-wal", "-shm"]:
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    kwargs = {"db_name": db_name, "table_name": "bench", **SQLITE_PROFILES[profile]}
+    Database(**kwargs).close()
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(_ingest_worker, kwargs, w, n_rows, img_kb, insert_freq) for w in range(n_workers)]
+        ids = [i for f in futures for i in f.result()]
+    elapsed = time.perf_counter() - start
+
+    db = Database(**kwargs)
+    stored = sum(len(db.get_ids(f"tag{w}")) for w in range(n_workers))
+    db.close()
+    print(f"[INFO] {n_workers} processes: {len(ids)/elapsed:.1f} rows/s, {len(ids)} ids / {len(set(ids))} unique / {stored} stored")
+    for suffix in ["", "-wal", "-shm"]:
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
+# (format, quality, max size) of `transcode_*` in `spider_settings`, None format stores as downloaded
+TRANSCODE_POLICIES = [(None, None, None), ("jpeg", 85, 1080), ("webp", 80, 1080), ("webp", 80, None)]
+
+def make_photo(size=(1440, 1440), seed=0) -> bytes:
+    r"""photo-like JPEG(gradients with a bit of noise), compresses like a real photo unlike `make_jpeg`"""
+    import io
+    import random
+    from PIL import Image
+
+    rnd = random.Random(seed)
+    bands = [Image.linear_gradient("L").rotate(rnd.randrange(360)).resize(size) for _ in range(3)]
+    img = Image.merge("RGB", bands)
+    noise = Image.merge("RGB", [Image.effect_noise(size, 40)] * 3)
+    img = Image.blend(img, noise, 0.15)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+def bench_transcode(fixtures_path: str, n_imgs: int):
+    r"""compression ratio and cpu time per image of transcode policies, and the extract throughput of the results"""
+    import shutil
+    from src.database import Database
+    from src.imaging import transcode
+
+    if fixtures_path is not None:
+        imgs = [x.read_bytes() for x in sorted(Path(fixtures_path).glob("*.jpg"))[:n_imgs]]
+    else:
+        imgs = [make_photo(seed=i) for i in range(n_imgs)]
+    original_bytes = sum(len(img) for img in imgs)
+    print(f"[INFO] {len(imgs)} images, {original_bytes/2**20:.1f}MB")
+
+    for fmt, quality, max_size in TRANSCODE_POLICIES:
+        cpu_start = time.process_time()
+        res = imgs if fmt is None else [transcode(img, fmt, quality, max_size) for img in imgs]
+        cpu = time.process_time() - cpu_start
+        n_bytes = sum(len(img) for img in res)
+
+        db_name = "bench_transcode.db"
+        db_path = Path("./database") / db_name
+        for suffix in ["", "-wal", "-shm"]:
+            Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+        db = Database(db_name=db_name, table_name="bench")
+        db.ingest([[None, "bench", f"/p/{i}/", "post", [img], "", i, "2021-01-01", 0] for i, img in enumerate(res)])
+        out_path = Path(tempfile.mkdtemp())
+        start = time.perf_counter()
+        for idx in db.get_ids("bench"):
+            for i, h in enumerate(db.get_post_images(idx), 1):
+                with (out_path / f"{idx}_{i}").open("wb") as file:
+                    db.copy_image(h, file)
+        elapsed = time.perf_counter() - start
+        db.close()
+        shutil.rmtree(out_path)
+        for suffix in ["", "-wal", "-shm"]:
+            Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
+        name = "original" if fmt is None else f"{fmt} q{quality} max {max_size}"
+        print(f"[INFO] {name}: ratio {original_bytes/n_bytes:.2f}x ({n_bytes/2**20:.1f}MB), "
+            f"{cpu/len(imgs)*1000:.1f}ms cpu per image, extract {len(imgs)/elapsed:.0f} images/s ({n_bytes/2**20/elapsed:.1f}MB/s)")
+
+def bench_search(n_rows: int, repeat: int):
+    r"""latency of full-text search(`Database.search_posts`) over `n_rows` synthetic posts"""
+    import random
+    from src.database import Database
+
+    rnd = random.Random(0)
+    words = [f"word{i}" for i in range(5000)]
+    hashtags = [f"#tag{i}" for i in range(500)]
+    db_name = "bench_search.db"
+    db_path = Path("./database") / db_name
+    for suffix in ["", "-wal", "-shm"]:
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    db = Database(db_name=db_name, table_name="bench", journal_mode="WAL", synchronous="OFF")
+    start = time.perf_counter()
+    for i in range(0, n_rows, 10000):
+        batch = []
+        for idx in range(i, min(i + 10000, n_rows)):
+            tags = " ".join(rnd.sample(hashtags, 3))
+            post = " ".join(rnd.choices(words, k=20)) + " " + tags
+            batch.append([None, f"tag{idx % 10}", f"/p/{idx}/", post, [], tags, idx, "2021-01-01", rnd.randrange(1000)])
+        db.ingest(batch)
+    print(f"[INFO] {n_rows} posts inserted and indexed in {time.perf_counter()-start:.1f}s")
+
+    queries = [("word1", None, "bm25"), ('"word1 word2"', None, "bm25"), ("#tag1", None, "bm25"),
+        ("#tag1", "tag3", "bm25"), ("#tag1 word7", None, "likes"), ('"word1 #tag1" #tag2', None, "bm25"),
+        ("word1 OR word2", "tag3", "likes")]
+    for query, tag, order in queries:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            res = db.search_posts(query, tag=tag, order=order, limit=100)
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"[INFO] {query!r} tag={tag} order={order}: {elapsed*1000:.2f}ms, {len(res)} posts(limit 100)")
+    db.close()
+    for suffix in ["", "-wal", "-shm"]:
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
+def bench_tensors(n_rows: int, n_workers: int, size: int=224):
+    r"""images/s of decoding into the tensor cache(`build_tensor_cache`) with `n_workers` processes,
+    against reading the decoded images back from the memmap and decoding them from database on every read"""
+    import random
+    import shutil
+    import numpy as np
+    from src.database import Database
+    from src.imaging import decode_resized
+    from src.tensors import build_tensor_cache, TensorCache
+
+    db_name = "bench_tensors.db"
+    db_path = Path("./database") / db_name
+    for suffix in ["", "-wal", "-shm"]:
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    conf_db = {"db_name": db_name, "table_name": "bench", "journal_mode": "WAL"}
+    db = Database(**conf_db)
+    photos = [make_photo(size=(1080, 1080), seed=i) for i in range(20)]
+    # distinct images, an image is stored once for all its posts
+    db.ingest([[None, "bench", f"/p/{i}/", "post", [photos[i % 20] + i.to_bytes(4, "big")], "", i, "2021-01-01", 0]
+        for i in range(n_rows)])
+    db.close()
+
+    cache_path = Path(tempfile.mkdtemp())
+    for workers in sorted({1, n_workers}):
+        shutil.rmtree(cache_path, ignore_errors=True)
+        stats = build_tensor_cache(conf_db, cache_path, "bench", size=(size, size), workers=workers)
+        print(f"[INFO] build({workers} workers): {stats['new']/stats['seconds']:.0f} images/s decoded")
+
+    cache = TensorCache(cache_path)
+    order = random.Random(0).sample(range(len(cache)), len(cache))
+    start = time.perf_counter()
+    total = 0
+    for k in order:
+        total += int(np.asarray(cache.images[k])[0, 0, 0])
+    elapsed = time.perf_counter() - start
+    print(f"[INFO] read back(random order): {len(order)/elapsed:.0f} images/s")
+
+    db = Database(**conf_db)
+    ids = db.get_ids("bench")
+    start = time.perf_counter()
+    for idx in ids:
+        for h in db.get_post_images(idx):
+            np.asarray(decode_resized(db.get_image(h), (size, size)))
+    elapsed = time.perf_counter() - start
+    print(f"[INFO] decode from database(1 process): {len(ids)/elapsed:.0f} images/s")
+    db.close()
+    shutil.rmtree(cache_path)
+    for suffix in ["", "-wal", "-shm"]:
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark")
+    parser.add_argument("--bench", type=str,
+        help="download / parser / carousel / parquet / fetch / sqlite / ingest / transcode / search / tensors")
+    parser.add_argument("--n_imgs", type=int, default=50,
+        help="number of fixture images")
+    parser.add_argument("--delay", type=float, default=0.05,
+        help="latency(seconds) of the local stand-in server")
+    parser.add_argument("--fixtures", type=str, default=None,
+        help=f"directory of saved post pages(*.html and *.links.txt from `Instagram.record_fixture`), {FIXTURES_PATH} if not set. "
+            "Images(*.jpg) of `transcode`, synthetic images if not set")
+    parser.add_argument("--synthetic", action="store_true",
+        help="`parser` and `carousel` use a synthetic page instead of the fixtures")
+    parser.add_argument("--repeat", type=int, default=20,
+        help="number of repeats")
+    parser.add_argument("--n_posts", type=int, default=20,
+        help="number of posts served by the local stand-in server")
+    parser.add_argument("--parser", type=str, default="html.parser",
+        help="parser backend")
+    parser.add_argument("--driver_path", type=str, default=None,
+        help="chrome driver path, also run the browser path if set")
+    parser.add_argument("--n_rows", type=int, default=500,
+        help="number of rows to insert")
+    parser.add_argument("--img_kb", type=int, default=100,
+        help="KB of each image, 3 images per row")
+    parser.add_argument("--insert_freq", type=int, default=5,
+        help="commit every n rows")
+    parser.add_argument("--profiles", type=str, nargs="*", default=None,
+        help=f"sqlite profiles, all when not set: {list(SQLITE_PROFILES)}")
+    parser.add_argument("--n_workers", type=int, default=4,
+        help="number of ingesting processes")
+    args = parser.parse_args()
+    pages_path = None if args.synthetic else (args.fixtures or FIXTURES_PATH)
+    if args.bench == "download":
+        bench_download(args.n_imgs, args.delay)
+    elif args.bench == "parser":
+        bench_parser(pages_path, args.repeat)
+    elif args.bench == "carousel":
+        check_carousel(pages_path)
+    elif args.bench == "parquet":
+        check_parquet()
+    elif args.bench == "fetch":
+        bench_fetch(args.n_posts, 3, args.delay, args.parser, args.driver_path)
+    elif args.bench == "sqlite":
+        bench_sqlite(args.n_rows, args.img_kb, args.insert_freq, args.profiles)
+    elif args.bench == "ingest":
+        for profile in (args.profiles or ["default", "wal"]):
+            bench_ingest(args.n_workers, args.n_rows, args.img_kb, args.insert_freq, profile)
+    elif args.bench == "transcode":
+        bench_transcode(args.fixtures, args.n_imgs)
+    elif args.bench == "search":
+        bench_search(args.n_rows, args.repeat)
+    elif args.bench == "tensors":
+        bench_tensors(args.n_rows, args.n_workers)
+    else:
+        raise Exception("Not supported, insert `--bench` download / parser / carousel / fetch / sqlite / ingest / transcode / search")
@@ -0,0 +1,42 @@
+from src import ShardedDatabase, open_database, load_settings
+
+def migrate(settings_path, vacuum, check_plans, rebalance, thumbnails, dedupe):
+    conf = load_settings(settings_path)
+    # schema migrations are applied when the database is opened
+    db = open_database(**conf["db_settings"], dedupe=dedupe)
+    print(f"[INFO] Schema version: {db.get_schema_version()}")
+    if rebalance and isinstance(db, ShardedDatabase):
+        # move the tags to the shards of current `shards`
+        print(f"[INFO] Rebalanced tags: {db.rebalance()}")
+    stats = db.migrate_images()
+    print(f"[INFO] Images: {stats['referred_images']} referred / {stats['stored_images']} stored")
+    print(f"[INFO] Bytes: {stats['referred_bytes']/2**20:.1f}MB referred / {stats['stored_bytes']/2**20:.1f}MB stored / {stats['saved_bytes']/2**20:.1f}MB saved")
+    if thumbnails:
+        # generate the missing thumbnails of the images stored before `thumbnail_size` was set
+        db.backfill_thumbnails()
+    if vacuum:
+        print("[INFO] Vacuum database...")
+        db.vacuum()
+    if check_plans:
+        for name, details in db.check_query_plans().items():
+            print(f"[INFO] {name}: {' / '.join(details)}")
+        print("[INFO] No query scans the table.")
+    db.close()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Migrate database")
+    parser.add_argument("--settings_path", type=str, default="./settings.yaml",
+        help="settings path")
+    parser.add_argument("--vacuum", action="store_true",
+        help="give the freed space back to disk after migration")
+    parser.add_argument("--check_plans", action="store_true",
+        help="check that none of the queries scans the table with `EXPLAIN QUERY PLAN`")
+    parser.add_argument("--rebalance", action="store_true",
+        help="(sharded) move the tags to the shards after `shards` of `db_settings` is changed")
+    parser.add_argument("--thumbnails", action="store_true",
+        help="generate the missing thumbnails of stored images")
+    parser.add_argument("--dedupe", action="store_true",
+        help="remove the duplicated (tag, postlink) posts of old tables, removed ids are logged to remap labels")
+    args = parser.parse_args()
+    migrate(args.settings_path, args.vacuum, args.check_plans, args.rebalance, args.thumbnails, args.dedupe)
@@ -1,10 +1,13 @@
-from .insta import Instagram
-from .database import Database
+from .insta import Instagram, InstagramPool, PostFetcher
+from .database import Database, DatabaseWriter
+from .sharding import ShardedDatabase, open_database
+from .packed import PackedDataset
+from .tensors import TensorCache
 from .wrapper import Spider
 from .labeler import Labeler
 from .utils import load_settings
 
 
 __all__ = [
-    Instagram, Database, Spider, Labeler, load_settings
+    Instagram, InstagramPool, PostFetcher, Database, DatabaseWriter, ShardedDatabase, open_database, PackedDataset, TensorCache, Spider, Labeler, load_settings
 ]
\ No newline at end of file
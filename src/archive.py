@@ -0,0 +1,119 @@
+import os
+import tarfile
+from pathlib import Path
+from typing import Union, Callable, BinaryIO
+
+class TarShardWriter:
+    def __init__(self, path: Path, prefix: str, shard_size: int=512 * 2**20):
+        r"""write members into tar shards `{path}/{prefix}-{n:06d}.tar`, a new shard is started when the shard
+        exceeds `shard_size` bytes at `next_sample`, so the members of a sample(post) are never split.
+        Members are streamed into the file, every shard has an index `{shard}.idx` of `name\toffset\tsize` lines,
+        `offset` is the position of the member data in the tar, read a member with `seek(offset)` and `read(size)`.
+
+        Args:
+            path (Path): output directory
+            prefix (str): shard name prefix
+            shard_size (int, optional): bytes of a shard. Defaults to 512MB.
+        """
+        self.path = Path(path)
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.n_shards = 0
+        self.n_bytes = 0
+        self.file = None
+        self.index = None
+
+    def next_sample(self):
+        if self.file is not None and self.file.tell() >= self.shard_size:
+            self._close_shard()
+        if self.file is None:
+            self._open_shard(self.path / f"{self.prefix}-{self.n_shards:06d}.tar")
+
+    def _open_shard(self, shard_path: Path):
+        self.file = shard_path.open("wb")
+        self.index = shard_path.with_suffix(".idx").open("w", encoding="utf-8")
+        self.n_shards += 1
+
+    def add(self, name: str, data: bytes):
+        self.add_stream(name, len(data), lambda writer: writer.write(data))
+
+    def add_stream(self, name: str, size: int, copy: Callable[[BinaryIO], int]):
+        r"""add a member of `size` bytes, `copy(writer)` writes the data and returns the bytes written"""
+        if self.file is None:
+            self.next_sample()
+        info = tarfile.TarInfo(name)
+        info.size = size
+        self.file.write(info.tobuf(tarfile.GNU_FORMAT))
+        offset = self.file.tell()
+        n_bytes = copy(self.file)
+        if n_bytes != size:
+            raise Exception(f"[Error] Member {name} of {self.file.name}: {n_bytes} bytes written, expected {size}")
+        # pad the data to tar blocks
+        remainder = size % tarfile.BLOCKSIZE
+        if remainder:
+            self.file.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+        print(f"{name}\t{offset}\t{size}", file=self.index)
+        self.n_bytes += size
+
+    def _close_shard(self):
+        # end-of-archive: two zero blocks, padded to a full record
+        self.file.write(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+        remainder = self.file.tell() % tarfile.RECORDSIZE
+        if remainder:
+            self.file.write(tarfile.NUL * (tarfile.RECORDSIZE - remainder))
+        self.file.close()
+        self.index.close()
+        self.file, self.index = None, None
+
+    def close(self):
+        if self.file is not None:
+            self._close_shard()
+
+def next_shard_prefix(path: Path) -> str:
+    r"""prefix after the existing shards of `TarShardWriter` in path, e.g. "0002" when `0000-*`, `0001-*` exist"""
+    parts = [int(p.name.split("-", 1)[0]) for p in Path(path).glob("*-*.tar")
+        if p.name.split("-", 1)[0].isdigit()]
+    return f"{max(parts, default=-1) + 1:04d}"
+
+def remove_shards(path: Path) -> int:
+    r"""remove the shards of `TarShardWriter` and their indexes in path. Returns the number of removed shards"""
+    shards = [p for p in Path(path).glob("*-*.tar") if p.name.split("-", 1)[0].isdigit()]
+    for p in shards:
+        p.with_suffix(".idx").unlink(missing_ok=True)
+        p.unlink()
+    return len(shards)
+
+def remove_samples(path: Path, keys: set) -> int:
+    r"""remove the members of the samples in `keys`(member names before the first `.`, e.g. post ids)
+    from the shards of `TarShardWriter` in path. The shards holding them are rewritten with the other members
+    and replaced with their indexes, shards left empty are removed. Returns the number of removed members.
+    """
+    removed = 0
+    for shard_path in sorted(p for p in Path(path).glob("*-*.tar") if p.name.split("-", 1)[0].isdigit()):
+        index_path = shard_path.with_suffix(".idx")
+        members = read_index(index_path)
+        kept = [m for m in members if m[0].split(".", 1)[0] not in keys]
+        if len(kept) == len(members):
+            continue
+        removed += len(members) - len(kept)
+        if not kept:
+            index_path.unlink()
+            shard_path.unlink()
+            continue
+        tmp_path = shard_path.with_name(shard_path.stem + ".tmp.tar")
+        writer = TarShardWriter(shard_path.parent, "")
+        writer._open_shard(tmp_path)
+        with shard_path.open("rb") as reader:
+            for name, offset, size in kept:
+                reader.seek(offset)
+                writer.add(name, reader.read(size))
+        writer.close()
+        os.replace(tmp_path, shard_path)
+        os.replace(tmp_path.with_suffix(".idx"), index_path)
+    return removed
+
+def read_index(index_path: Union[str, Path]) -> list:
+    r"""(name, offset, size) of the members of a shard index"""
+    with Path(index_path).open("r", encoding="utf-8") as file:
+        return [(name, int(offset), int(size))
+            for name, offset, size in (line.rstrip("\n").rsplit("\t", 2) for line in file)]
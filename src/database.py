@@ -1,22 +1,155 @@
+import re
+import time
+import random
 import sqlite3
-from typing import List, Tuple
+import hashlib
+from queue import Queue, Empty, Full
+from threading import Thread
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Callable, Union, Iterator, BinaryIO
+from .imaging import make_thumbnail
 
 class Database:
     IMG_SPLIT_TAG = b"<IMG>"
+    # migrations in order, the schema version is the number of applied migrations
+    MIGRATIONS = [
+        "create_post_table", "create_unique_index", "create_tags_table",
+        "create_images_table", "create_lookup_indexes", "create_autoincrement_ids",
+        "create_thumbnails_table", "create_originals_table", "create_search_table"
+    ]
+    # read queries, formatted with table names. `check_query_plans` makes sure they use indexes
+    QUERIES = {
+        "get_postlinks": """SELECT postlink FROM {table} WHERE tag = ?
+            UNION SELECT postlink FROM {tags} WHERE tag = ?""",
+        "get_all_postlinks": """SELECT postlink FROM {table}""",
+        "get_tags": """SELECT DISTINCT tag FROM {view}""",
+        "get_ids": """SELECT id FROM {view} WHERE tag = ? ORDER BY id""",
+        "count_posts": """SELECT COUNT(*) FROM {view} WHERE tag = ?""",
+        "count_all_posts": """SELECT COUNT(*) FROM {table}""",
+        "get_id_range": """SELECT MIN(id), MAX(id) FROM {view} WHERE tag = ?""",
+        "get_next_id": """SELECT MIN(id) FROM {view} WHERE tag = ? AND id > ?""",
+        "get_prev_id": """SELECT MAX(id) FROM {view} WHERE tag = ? AND id < ?""",
+        "get_post": """SELECT uid, postlink, post, othertags FROM {table} WHERE id = ?""",
+        "get_posts": """SELECT id, postlink, uid, post, othertags, date, likes FROM {table}
+            WHERE id IN (SELECT id FROM {view} WHERE tag = ?)""",
+        "get_posts_range": """SELECT id, postlink, uid, post, othertags, date, likes FROM {table}
+            WHERE id IN (SELECT id FROM {view} WHERE tag = ? AND id BETWEEN ? AND ?) ORDER BY id""",
+        "get_posts_digest": """SELECT t.id, t.postlink, t.uid, t.post, t.othertags, t.date, t.likes, length(t.imgs),
+                (SELECT group_concat(hash) FROM (SELECT hash FROM {post_images} WHERE post_id = t.id ORDER BY idx))
+            FROM {table} AS t WHERE t.id IN (SELECT id FROM {view} WHERE tag = ?) ORDER BY t.id""",
+        "get_posts_meta": """SELECT t.id, t.postlink, t.post, t.othertags, t.uid, t.date, t.likes,
+                COUNT(p.hash), COALESCE(SUM(i.size), 0)
+            FROM {table} AS t
+                LEFT JOIN {post_images} AS p ON p.post_id = t.id
+                LEFT JOIN {images} AS i ON i.hash = p.hash
+            WHERE t.id IN (SELECT id FROM {view} WHERE tag = ?)
+            GROUP BY t.id ORDER BY t.id""",
+        "get_post_images": """SELECT hash FROM {post_images} WHERE post_id = ? ORDER BY idx""",
+        "get_image": """SELECT data FROM {images} WHERE hash = ?""",
+        "get_image_ref": """SELECT rowid, size FROM {images} WHERE hash = ?""",
+        "get_image_chunk": """SELECT substr(data, ?, ?) FROM {images} WHERE rowid = ?""",
+        "get_thumbnail": """SELECT data FROM {thumbnails} WHERE hash = ?""",
+        "get_thumbnail_row": """SELECT data, width, height FROM {thumbnails} WHERE hash = ?""",
+        "get_original": """SELECT data FROM {originals} WHERE hash = ?""",
+        "get_legacy_imgs": """SELECT imgs FROM {table} WHERE id = ?""",
+        "get_last_id": """SELECT id FROM {table} WHERE id = (SELECT MAX(id) FROM {table})""",
+        # full-text search, (id, bm25 rank, likes) of the matched posts.
+        # the tag is filtered on the joined rows, `rowid IN (view)` would be pushed into FTS5 and gets slow
+        "search": """SELECT {search}.rowid, rank, t.likes FROM {search} JOIN {table} AS t ON t.id = {search}.rowid
+            WHERE {search} MATCH ? ORDER BY rank LIMIT ?""",
+        "search_tag": """SELECT {search}.rowid, rank, t.likes FROM {search} JOIN {table} AS t ON t.id = {search}.rowid
+            WHERE {search} MATCH ? AND (t.tag = ? OR t.postlink IN (SELECT postlink FROM {tags} WHERE tag = ?))
+            ORDER BY rank LIMIT ?""",
+        "search_likes": """SELECT {search}.rowid, rank, t.likes FROM {search} JOIN {table} AS t ON t.id = {search}.rowid
+            WHERE {search} MATCH ? ORDER BY t.likes DESC LIMIT ?""",
+        "search_tag_likes": """SELECT {search}.rowid, rank, t.likes FROM {search} JOIN {table} AS t ON t.id = {search}.rowid
+            WHERE {search} MATCH ? AND (t.tag = ? OR t.postlink IN (SELECT postlink FROM {tags} WHERE tag = ?))
+            ORDER BY t.likes DESC LIMIT ?""",
+    }
+    SEARCH_ORDERS = ["bm25", "likes"]
+    # hashtags in search queries are matched as a token, e.g. `#food` -> `"#food"`.
+    # Phrases(`"..."`, `""` escapes a quote) are matched first and kept as they are, hashtags in them are already quoted
+    HASHTAG_QUERY_PATTERN = re.compile(r'("(?:[^"]|"")*"?)|(#[^\s"()]+)')
+    # connection settings of `db_settings`, applied in order when connected.
+    # `page_size` goes first, it can not be changed after the database is in WAL mode
+    PRAGMAS = ["page_size", "journal_mode", "synchronous", "cache_size", "mmap_size", "wal_autocheckpoint"]
+    # connection settings that apply to read-only connections
+    READ_PRAGMAS = ["cache_size", "mmap_size"]
 
     def __init__(self, **kwargs):
         self.db_name = "./database/" + kwargs["db_name"]
         self.table_name = kwargs["table_name"]
+        self.schema_table_name = f"{self.table_name}_schema"
+        # posts that appeared under more tags are stored once and linked to the other tags
+        self.tags_table_name = f"{self.table_name}_tags"
+        self.tag_ids_view_name = f"{self.table_name}_tag_ids"
+        # images are stored once by sha256 hash
+        self.images_table_name = f"{self.table_name}_images"
+        self.post_images_table_name = f"{self.table_name}_post_images"
+        # display size derivatives of the images, generated when inserted if `thumbnail_size` is set
+        self.thumbnails_table_name = f"{self.table_name}_thumbnails"
+        self.thumbnail_size = kwargs.get("thumbnail_size")
+        self.thumbnail_quality = kwargs.get("thumbnail_quality", 85)
+        # original bytes of the transcoded images, only when asked to keep them
+        self.originals_table_name = f"{self.table_name}_originals"
+        # FTS5 index of post text and hashtags
+        self.search_table_name = f"{self.table_name}_search"
+        # journal mode, synchronous level, cache and checkpoint policy, sqlite defaults when not set
+        self.pragmas = {k: kwargs[k] for k in self.PRAGMAS if kwargs.get(k) is not None}
+        self.checkpoint_on_close = kwargs.get("checkpoint_on_close")
+        # concurrent writers(other processes): wait for the lock `busy_timeout` ms, then retry `retries` times
+        self.busy_timeout = kwargs.get("busy_timeout", 5000)
+        self.retries = kwargs.get("retries", 5)
+        # read-only connection(e.g. extract workers), the schema is not created or migrated
+        self.read_only = kwargs.get("read_only", False)
+        # allow `create_unique_index` to remove the duplicated posts of old tables
+        self.dedupe = kwargs.get("dedupe", False)
+        if self.read_only:
+            self.pragmas = {k: v for k, v in self.pragmas.items() if k in self.READ_PRAGMAS}
+            self.checkpoint_on_close = None
         self.start()
-        self.create_table()
+        if not self.read_only:
+            self.create_table()
 
     def create_table(self):
+        r"""create or migrate the tables to the latest schema version"""
+        def create_schema_table():
+            c = self.get_cursor()
+            c.execute(f"""CREATE TABLE IF NOT EXISTS {self.schema_table_name} (version INTEGER)""")
+            if c.execute(f"""SELECT COUNT(*) FROM {self.schema_table_name}""").fetchone()[0] == 0:
+                c.execute(f"""INSERT INTO {self.schema_table_name} VALUES (0)""")
+            c.close()
+        self.write_transaction(create_schema_table)
+        self.migrate()
+
+    def get_schema_version(self) -> int:
+        return self._fetch_column(f"""SELECT version FROM {self.schema_table_name}""")[0]
+
+    def migrate(self):
+        r"""apply the migrations after current schema version, every migration is committed with its version.
+        Each migration holds the write lock(`write_transaction`), a migration done by another process meanwhile is skipped.
+        """
+        def apply(i: int, name: str) -> bool:
+            if self.get_schema_version() >= i:
+                return False
+            getattr(self, name)()
+            c = self.get_cursor()
+            c.execute(f"""UPDATE {self.schema_table_name} SET version = ?""", (i,))
+            c.close()
+            return True
+
+        version = self.get_schema_version()
+        for i, name in enumerate(self.MIGRATIONS[version:], version + 1):
+            if self.write_transaction(lambda: apply(i, name)) and version > 0:
+                print(f"[INFO] Table: {self.table_name} migrated to version {i}: {name}")
+
+    def create_post_table(self):
         r"""
         id INTEGER: id 
         tag TEXT: searched tag
         postlink TEXT: post link 
         post TEXT: post
-        imgs BLOB: byte object of the post
+        imgs BLOB: (legacy) `IMG_SPLIT_TAG` joined images, images are stored in {table_name}_images now
         othertags TEXT: other tags that linked
         uid INTEGER: hashed userid
         date TEXT: time of the post (%Y-%m-%d)
@@ -36,50 +169,819 @@ class Database:
         else:
             print(f"[INFO] Table: {self.table_name} exists.")
         c.close()
+
+    def create_unique_index(self):
+        r"""a post can be inserted only once per tag. Old tables may have duplicated (tag, postlink) rows,
+        they are removed only with `dedupe`(the first id is kept), the removed ids are logged into
+        `{db_name}.dedupe.txt` as `removed id\tkept id\ttag\tpostlink` lines to remap labels of the removed ids.
+        """
+        index_name = f"{self.table_name}_tag_postlink"
+        c = self.get_cursor()
+        res = c.execute(f"SELECT COUNT(*) FROM sqlite_master WHERE name='{index_name}'")
+        if res.fetchone()[0] > 0:
+            c.close()
+            return
+        sql = f"""SELECT t.id, k.id, t.tag, t.postlink FROM {self.table_name} AS t
+            JOIN (SELECT MIN(id) AS id, tag, postlink FROM {self.table_name} GROUP BY tag, postlink) AS k
+                ON k.tag = t.tag AND k.postlink = t.postlink
+            WHERE t.id != k.id ORDER BY t.id"""
+        duplicates = c.execute(sql).fetchall()
+        if duplicates and not self.dedupe:
+            c.close()
+            raise Exception(f"[Error] Table: {self.table_name} has {len(duplicates)} duplicated (tag, postlink) rows, "
+                "labels of their ids would be lost. Run `python migrate.py --dedupe` to remove them(the first id is kept, "
+                "removed ids are logged)")
+        if duplicates:
+            log_path = f"{self.db_name}.dedupe.txt"
+            with open(log_path, "a", encoding="utf-8") as file:
+                for removed, kept, tag, postlink in duplicates:
+                    print(f"{removed}\t{kept}\t{tag}\t{postlink}", file=file)
+            c.executemany(f"""DELETE FROM {self.table_name} WHERE id = ?""", [(x[0],) for x in duplicates])
+            print(f"[INFO] Table: {self.table_name} removed {len(duplicates)} duplicated rows, logged in {log_path}")
+        c.execute(f"""CREATE UNIQUE INDEX {index_name} ON {self.table_name} (tag, postlink)""")
+        c.close()
     
+    def create_tags_table(self):
+        r"""
+        {table_name}_tags: other tags that the post appeared under
+            tag TEXT: searched tag
+            postlink TEXT: post link, stored in {table_name} under another tag
+        {table_name}_tag_ids: view of (tag, id) pairs include the linked posts
+        """
+        c = self.get_cursor()
+        c.execute(f"""CREATE TABLE IF NOT EXISTS {self.tags_table_name} (
+            tag TEXT, postlink TEXT, PRIMARY KEY (tag, postlink))""")
+        c.execute(f"""CREATE VIEW IF NOT EXISTS {self.tag_ids_view_name} AS
+            SELECT tag, id FROM {self.table_name}
+            UNION ALL
+            SELECT l.tag, MIN(t.id) FROM {self.tags_table_name} AS l
+                JOIN {self.table_name} AS t ON t.postlink = l.postlink
+                GROUP BY l.tag, l.postlink""")
+        c.close()
+
+    def create_images_table(self):
+        r"""
+        {table_name}_images: content addressed images
+            hash TEXT: sha256 of the image
+            data BLOB: image bytes
+            size INTEGER: bytes of the image
+            refcount INTEGER: number of posts that refer the image
+        {table_name}_post_images: images of the post in order
+            post_id INTEGER: id of the post
+            idx INTEGER: order of the image in the post, starts from 0
+            hash TEXT: sha256 of the image
+        """
+        c = self.get_cursor()
+        c.execute(f"""CREATE TABLE IF NOT EXISTS {self.images_table_name} (
+            hash TEXT PRIMARY KEY, data BLOB, size INTEGER, refcount INTEGER)""")
+        c.execute(f"""CREATE TABLE IF NOT EXISTS {self.post_images_table_name} (
+            post_id INTEGER, idx INTEGER, hash TEXT, PRIMARY KEY (post_id, idx))""")
+        c.close()
+
+    def create_lookup_indexes(self):
+        r"""covering index for tag/id lookups and index for postlink lookups, rows with BLOB are not scanned"""
+        c = self.get_cursor()
+        c.execute(f"""CREATE INDEX IF NOT EXISTS {self.table_name}_tag_id ON {self.table_name} (tag, id)""")
+        c.execute(f"""CREATE INDEX IF NOT EXISTS {self.table_name}_postlink ON {self.table_name} (postlink)""")
+        c.close()
+
+    def create_autoincrement_ids(self):
+        r"""rebuild the table with `AUTOINCREMENT` ids assigned by database,
+        ids are unique among processes and ids of deleted posts are never reused(labels refer the ids)
+        """
+        c = self.get_cursor()
+        res = c.execute(f"SELECT sql FROM sqlite_master WHERE type='table' AND name='{self.table_name}'")
+        if "AUTOINCREMENT" in res.fetchone()[0].upper():
+            c.close()
+            return
+        columns = "id, tag, postlink, post, imgs, othertags, uid, date, likes"
+        rebuild_name = f"{self.table_name}_rebuild"
+        c.execute(f"DROP VIEW IF EXISTS {self.tag_ids_view_name}")
+        c.execute(f"""CREATE TABLE {rebuild_name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            tag TEXT, postlink TEXT, post TEXT, 
+            imgs BLOB, othertags TEXT, uid INTEGER, 
+            date TEXT, likes INTEGER)""")
+        c.execute(f"""INSERT INTO {rebuild_name} ({columns}) SELECT {columns} FROM {self.table_name}""")
+        c.execute(f"DROP TABLE {self.table_name}")
+        c.execute(f"ALTER TABLE {rebuild_name} RENAME TO {self.table_name}")
+        c.close()
+        self.create_unique_index()
+        self.create_tags_table()
+        self.create_lookup_indexes()
+
+    def create_thumbnails_table(self):
+        r"""
+        {table_name}_thumbnails: thumbnails of the images
+            hash TEXT: sha256 of the original image
+            data BLOB: JPEG bytes
+            width INTEGER: width of the thumbnail
+            height INTEGER: height of the thumbnail
+        """
+        c = self.get_cursor()
+        c.execute(f"""CREATE TABLE IF NOT EXISTS {self.thumbnails_table_name} (
+            hash TEXT PRIMARY KEY, data BLOB, width INTEGER, height INTEGER)""")
+        c.close()
+
+    def create_originals_table(self):
+        r"""
+        {table_name}_originals: original bytes of the images transcoded when ingested
+            hash TEXT: sha256 of the transcoded image
+            data BLOB: original bytes
+            size INTEGER: bytes of the original
+        """
+        c = self.get_cursor()
+        c.execute(f"""CREATE TABLE IF NOT EXISTS {self.originals_table_name} (
+            hash TEXT PRIMARY KEY, data BLOB, size INTEGER)""")
+        c.close()
+
+    def create_search_table(self):
+        r"""
+        {table_name}_search: FTS5 index of `post` and `othertags`(external content of {table_name}),
+            kept in sync by triggers. `#` is a token character, so hashtags are searched as a whole.
+        Skipped when sqlite is built without FTS5, `search` is not available then.
+        """
+        c = self.get_cursor()
+        try:
+            c.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS {self.search_table_name}
+                USING fts5(post, othertags, content='{self.table_name}', content_rowid='id',
+                tokenize="unicode61 tokenchars '#'")""")
+        except sqlite3.OperationalError as e:
+            print(f"[INFO] Table: {self.search_table_name} not created, full-text search is not available: {e}")
+            c.close()
+            return
+        columns = "post, othertags"
+        new = "new.post, new.othertags"
+        old = "old.post, old.othertags"
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {self.search_table_name}_insert AFTER INSERT ON {self.table_name} BEGIN
+            INSERT INTO {self.search_table_name} (rowid, {columns}) VALUES (new.id, {new});
+            END""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {self.search_table_name}_delete AFTER DELETE ON {self.table_name} BEGIN
+            INSERT INTO {self.search_table_name} ({self.search_table_name}, rowid, {columns}) VALUES ('delete', old.id, {old});
+            END""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {self.search_table_name}_update AFTER UPDATE OF {columns} ON {self.table_name} BEGIN
+            INSERT INTO {self.search_table_name} ({self.search_table_name}, rowid, {columns}) VALUES ('delete', old.id, {old});
+            INSERT INTO {self.search_table_name} (rowid, {columns}) VALUES (new.id, {new});
+            END""")
+        # index the existing posts
+        c.execute(f"""INSERT INTO {self.search_table_name} ({self.search_table_name}) VALUES ('rebuild')""")
+        c.close()
+
     def recreate(self):
         c = self.get_cursor()
+        c.execute(f"DROP TABLE IF EXISTS {self.search_table_name}")
+        c.execute(f"DROP TABLE IF EXISTS {self.originals_table_name}")
+        c.execute(f"DROP TABLE IF EXISTS {self.thumbnails_table_name}")
+        c.execute(f"DROP TABLE IF EXISTS {self.post_images_table_name}")
+        c.execute(f"DROP TABLE IF EXISTS {self.images_table_name}")
+        c.execute(f"DROP VIEW IF EXISTS {self.tag_ids_view_name}")
+        c.execute(f"DROP TABLE IF EXISTS {self.tags_table_name}")
+        c.execute(f"DROP TABLE IF EXISTS {self.schema_table_name}")
         c.execute(f"DROP TABLE {self.table_name}")
         print(f"[INFO] Table: {self.table_name} dropped.")
         self.create_table()
         c.close()
 
+    def get_sql(self, name: str) -> str:
+        return self.QUERIES[name].format(table=self.table_name, tags=self.tags_table_name,
+            view=self.tag_ids_view_name, images=self.images_table_name,
+            post_images=self.post_images_table_name, thumbnails=self.thumbnails_table_name,
+            originals=self.originals_table_name, search=self.search_table_name)
+
+    def check_query_plans(self) -> dict:
+        r"""`EXPLAIN QUERY PLAN` of every query in `QUERIES`, raise if any of them scans a table.
+        Full scans of a covering index(e.g. `SELECT DISTINCT tag`) and FTS5 index lookups are allowed.
+
+        Returns:
+            dict: query name: plan details
+        """
+        plans = {}
+        failed = []
+        c = self.get_cursor()
+        for name in self.QUERIES:
+            if name.startswith("search") and not self.has_search():
+                continue
+            sql = self.get_sql(name)
+            params = (0, ) * sql.count("?")
+            details = [x[-1] for x in c.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+            plans[name] = details
+            # scans of subquery results(views) are not table scans
+            subqueries = set(d.split()[-1] for d in details if d.startswith(("CO-ROUTINE", "MATERIALIZE")))
+            for d in details:
+                if d.startswith("SCAN") and "COVERING INDEX" not in d and "VIRTUAL TABLE" not in d \
+                        and d.split()[1] not in subqueries:
+                    failed.append(name)
+                    break
+        c.close()
+        if failed:
+            msg = "\n".join(f"{name}: {plans[name]}" for name in failed)
+            raise Exception(f"[Error] Queries scan the table:\n{msg}")
+        return plans
+
     def get_cursor(self):
         c = self.conn.cursor()
         return c
 
-    def insert(self, batch: List[Tuple]):
-        """insert into database
+    def insert(self, batch: List[Tuple], thumbnails: Union[dict, None]=None) -> list:
+        """insert into database, not committed. Use `ingest` when other processes write the database too.
 
         Args:
             batch (List[Tuple]): contains following datas
-                idx: int
+                idx: int, None to be assigned by database
                 tag: str
                 postlink: str
                 post: str
-                imgs: byte-str
+                imgs: list of image bytes or (transcoded bytes, original bytes), (legacy) `IMG_SPLIT_TAG` joined bytes
                 othertags: str
                 uid: int
                 date: str
                 likes: int
+            already inserted (tag, postlink) will be ignored
+            thumbnails (Union[dict, None], optional): result of `make_thumbnails`, made before the first write when None.
+
+        Returns:
+            list: ids of the rows, None for the ignored rows
         """        
+        if thumbnails is None:
+            thumbnails = self.make_thumbnails(batch)
         c = self.get_cursor()
-        sql = f"""INSERT INTO {self.table_name} VALUES (?,?,?,?,?,?,?,?,?)"""
-        c.executemany(sql, batch)
+        sql = f"""INSERT OR IGNORE INTO {self.table_name} VALUES (?,?,?,?,?,?,?,?,?)"""
+        ids = []
+        for row in batch:
+            imgs = row[4]
+            if isinstance(imgs, bytes):
+                imgs = imgs.split(self.IMG_SPLIT_TAG)
+            res = c.execute(sql, tuple(row[:4]) + (None, ) + tuple(row[5:]))
+            if res.rowcount > 0:
+                self.add_post_images(res.lastrowid, imgs, thumbnails)
+                ids.append(res.lastrowid)
+            else:
+                ids.append(None)
         c.close()
+        return ids
+
+    def ingest(self, batch: List[Tuple], retries: Union[int, None]=None, thumbnails: Union[dict, None]=None) -> list:
+        r"""insert and commit the batch in one write transaction(`write_transaction`), safe to be called by many
+        processes at once, it is retried with random backoff when the database is still locked.
+
+        Args:
+            batch (List[Tuple]): rows of `insert`, leave idx None to get database assigned ids
+            retries (Union[int, None], optional): number of retries, `retries` of `db_settings` when None. Defaults to None.
+            thumbnails (Union[dict, None], optional): {hash: (data, width, height)} to store, e.g. copied from
+                another database(`get_post_media`), made by `make_thumbnails` when None. Defaults to None.
+
+        Returns:
+            list: ids of the rows, None for the ignored rows
+        """
+        # encoding thumbnails is cpu work, never done while holding the write lock(or again on retries)
+        if thumbnails is None:
+            thumbnails = self.make_thumbnails(batch)
+        return self.write_transaction(lambda: self.insert(batch, thumbnails), retries)
+
+    def write_transaction(self, fn: Callable, retries: Union[int, None]=None):
+        r"""run `fn()` in a write transaction and commit, it is rolled back when `fn` raises.
+        The write lock is taken at the beginning(`BEGIN IMMEDIATE`), it waits `busy_timeout` for other writers
+        and retries with random backoff when the database is still locked. Returns the result of `fn`
+
+        Args:
+            fn (Callable): writes of the transaction, must not commit
+            retries (Union[int, None], optional): number of retries, `retries` of `db_settings` when None. Defaults to None.
+        """
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                self.begin_immediate()
+                res = fn()
+                self.commit()
+                return res
+            except Exception as e:
+                self.conn.rollback()
+                if not (isinstance(e, sqlite3.OperationalError) and self.is_locked_error(e)) or attempt == retries:
+                    raise
+                time.sleep(random.uniform(0, min(0.1 * 2**attempt, 5.0)))
+
+    def begin_immediate(self):
+        r"""start a write transaction now, instead of upgrading a read transaction later which can not wait for the lock"""
+        if self.conn.in_transaction:
+            self.commit()
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    @staticmethod
+    def is_locked_error(e: Exception) -> bool:
+        return "locked" in str(e) or "busy" in str(e)
+
+    def add_image(self, img: bytes) -> str:
+        r"""store the image once, increase the reference count if exists. Returns the sha256 hash"""
+        h = hashlib.sha256(img).hexdigest()
+        sql = f"""INSERT INTO {self.images_table_name} VALUES (?,?,?,1)
+            ON CONFLICT(hash) DO UPDATE SET refcount = refcount + 1"""
+        c = self.get_cursor()
+        c.execute(sql, (h, img, len(img)))
+        c.close()
+        return h
+
+    def make_thumbnails(self, batch: List[Tuple]) -> dict:
+        r"""thumbnails of the images of the rows(see `insert`) which have none stored yet, {hash: `make_thumbnail` result}.
+        Empty when `thumbnail_size` is not set."""
+        thumbnails = {}
+        if not self.thumbnail_size:
+            return thumbnails
+        for row in batch:
+            imgs = row[4]
+            if isinstance(imgs, bytes):
+                imgs = imgs.split(self.IMG_SPLIT_TAG)
+            for img in imgs:
+                img = img[0] if isinstance(img, tuple) else img
+                h = hashlib.sha256(img).hexdigest()
+                if h not in thumbnails and self.get_thumbnail(h) is None:
+                    thumbnails[h] = make_thumbnail(img, self.thumbnail_size, self.thumbnail_quality)
+        return thumbnails
+
+    def add_post_images(self, post_id: int, imgs: List[Union[bytes, tuple]], thumbnails: Union[dict, None]=None):
+        r"""store the images of the post in order, (transcoded, original) pairs also keep the original.
+        `thumbnails` of `make_thumbnails` are stored, they are made here when None"""
+        originals = [img[1] if isinstance(img, tuple) else None for img in imgs]
+        imgs = [img[0] if isinstance(img, tuple) else img for img in imgs]
+        hashes = [self.add_image(img) for img in imgs]
+        for h, original in zip(hashes, originals):
+            if original is not None:
+                self.add_original(h, original)
+        sql = f"""INSERT INTO {self.post_images_table_name} VALUES (?,?,?)"""
+        c = self.get_cursor()
+        c.executemany(sql, [(post_id, i, h) for i, h in enumerate(hashes)])
+        c.close()
+        if thumbnails is None:
+            thumbnails = self.make_thumbnails([(None, None, None, None, imgs)])
+        for h in hashes:
+            if h in thumbnails:
+                self.add_thumbnail(h, thumbnails[h])
+
+    def add_thumbnail(self, h: str, thumbnail: Union[Tuple[bytes, int, int], None]):
+        r"""store the result of `make_thumbnail`, nothing stored when the image could not be decoded"""
+        if thumbnail is None:
+            return
+        c = self.get_cursor()
+        c.execute(f"""INSERT OR REPLACE INTO {self.thumbnails_table_name} VALUES (?,?,?,?)""", (h, ) + thumbnail)
+        c.close()
+
+    def add_original(self, h: str, original: bytes):
+        c = self.get_cursor()
+        c.execute(f"""INSERT OR IGNORE INTO {self.originals_table_name} VALUES (?,?,?)""", (h, original, len(original)))
+        c.close()
+
+    def get_original(self, h: str) -> Union[bytes, None]:
+        r"""original bytes of the transcoded image, None when it is not kept"""
+        res = self._fetch_column(self.get_sql("get_original"), (h,))
+        return res[0] if res else None
+
+    def get_post_media(self, post_id: int) -> Tuple[list, dict]:
+        r"""images of the post in the form `add_post_images` takes, (image, original) when the original is kept,
+        and {hash: (data, width, height)} of their thumbnails. Copies a post into another database with `ingest`"""
+        hashes = self.get_post_images(post_id)
+        if not hashes:
+            # (legacy) not migrated `imgs` column
+            return self.get_images(post_id), {}
+        imgs, thumbnails = [], {}
+        c = self.get_cursor()
+        for h in hashes:
+            img, original = self.get_image(h), self.get_original(h)
+            imgs.append(img if original is None else (img, original))
+            res = c.execute(self.get_sql("get_thumbnail_row"), (h,)).fetchone()
+            if res is not None:
+                thumbnails[h] = tuple(res)
+        c.close()
+        return imgs, thumbnails
+
+    def get_thumbnail(self, h: str) -> Union[bytes, None]:
+        res = self._fetch_column(self.get_sql("get_thumbnail"), (h,))
+        return res[0] if res else None
+
+    def backfill_thumbnails(self, size: Union[int, None]=None, batch_size: int=100, workers: Union[int, None]=None) -> int:
+        r"""generate the missing thumbnails of stored images in processes, committed every `batch_size` images
+
+        Args:
+            size (Union[int, None], optional): thumbnail size, `thumbnail_size` or 640 when None. Defaults to None.
+            batch_size (int, optional): images per commit. Defaults to 100.
+            workers (Union[int, None], optional): number of processes, cpu count when None. Defaults to None.
+
+        Returns:
+            int: number of generated thumbnails
+        """
+        size = size or self.thumbnail_size or 640
+        sql = f"""SELECT hash FROM {self.images_table_name}
+            WHERE hash NOT IN (SELECT hash FROM {self.thumbnails_table_name})"""
+        hashes = self._fetch_column(sql)
+        n_done = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for i in range(0, len(hashes), batch_size):
+                batch = hashes[i:i+batch_size]
+                imgs = [self.get_image(h) for h in batch]
+                thumbnails = executor.map(make_thumbnail, imgs, [size] * len(imgs), [self.thumbnail_quality] * len(imgs))
+                for h, thumbnail in zip(batch, thumbnails):
+                    self.add_thumbnail(h, thumbnail)
+                    n_done += thumbnail is not None
+                self.commit()
+        print(f"[INFO] Table: {self.table_name} generated {n_done} thumbnails of {len(hashes)} images.")
+        return n_done
+
+    def get_image(self, h: str) -> bytes:
+        sql = self.get_sql("get_image")
+        c = self.get_cursor()
+        res = c.execute(sql, (h,)).fetchone()
+        c.close()
+        if res is None:
+            raise Exception(f"[Error] Image not exists: {h}")
+        return res[0]
+
+    def has_image(self, h: str) -> bool:
+        return bool(self._fetch_column(self.get_sql("get_image_ref"), (h,)))
+
+    def get_image_size(self, h: str) -> int:
+        return self._get_image_ref(h)[1]
+
+    def iter_image_chunks(self, h: str, chunk_size: int=2**16) -> Iterator[bytes]:
+        r"""read the image in chunks with incremental BLOB I/O, the whole image is never held in memory.
+        Falls back to `substr` queries when `blobopen` is not available(python < 3.11)
+        """
+        rowid, size = self._get_image_ref(h)
+        if hasattr(self.conn, "blobopen"):
+            with self.conn.blobopen(self.images_table_name, "data", rowid, readonly=True) as blob:
+                while True:
+                    chunk = blob.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        else:
+            sql = self.get_sql("get_image_chunk")
+            for offset in range(0, size, chunk_size):
+                # substr of BLOB is 1-indexed
+                yield self._fetch_column(sql, (offset + 1, chunk_size, rowid))[0]
+
+    def copy_image(self, h: str, writer: BinaryIO, chunk_size: int=2**16) -> int:
+        r"""write the image into a file-like object in chunks. Returns the number of bytes written"""
+        n_bytes = 0
+        for chunk in self.iter_image_chunks(h, chunk_size):
+            writer.write(chunk)
+            n_bytes += len(chunk)
+        return n_bytes
+
+    def _get_image_ref(self, h: str) -> tuple:
+        c = self.get_cursor()
+        res = c.execute(self.get_sql("get_image_ref"), (h,)).fetchone()
+        c.close()
+        if res is None:
+            raise Exception(f"[Error] Image not exists: {h}")
+        return res
+
+    def get_post_images(self, post_id: int) -> list:
+        r"""image hashes of the post in order"""
+        sql = self.get_sql("get_post_images")
+        return self._fetch_column(sql, (post_id,))
+
+    def iter_post_images(self, post_id: int) -> Iterator[Tuple[int, Callable[[BinaryIO], int]]]:
+        r"""(size, copy) of the images of the post in order, `copy(writer)` writes the image into a file-like object
+        in chunks and returns the bytes written. The (legacy) not migrated `imgs` column is read when there is no hash.
+        """
+        hashes = self.get_post_images(post_id)
+        if hashes:
+            for h in hashes:
+                yield self.get_image_size(h), lambda writer, h=h: self.copy_image(h, writer)
+        else:
+            for img in self.get_images(post_id):
+                yield len(img), lambda writer, img=img: writer.write(img)
+
+    def get_images(self, post_id: int) -> List[bytes]:
+        r"""image bytes of the post in order, read the legacy `imgs` column if not migrated"""
+        hashes = self.get_post_images(post_id)
+        if hashes:
+            return [self.get_image(h) for h in hashes]
+        sql = self.get_sql("get_legacy_imgs")
+        res = self._fetch_column(sql, (post_id,))
+        if res and res[0] is not None:
+            return res[0].split(self.IMG_SPLIT_TAG)
+        return []
+
+    def delete_post(self, post_id: int):
+        r"""delete the post, the images that no longer referred are deleted"""
+        c = self.get_cursor()
+        for h in self.get_post_images(post_id):
+            c.execute(f"""UPDATE {self.images_table_name} SET refcount = refcount - 1 WHERE hash = ?""", (h,))
+        for table in [self.thumbnails_table_name, self.originals_table_name]:
+            c.execute(f"""DELETE FROM {table} WHERE hash IN (
+                SELECT hash FROM {self.images_table_name} WHERE refcount <= 0)""")
+        c.execute(f"""DELETE FROM {self.images_table_name} WHERE refcount <= 0""")
+        c.execute(f"""DELETE FROM {self.post_images_table_name} WHERE post_id = ?""", (post_id,))
+        c.execute(f"""DELETE FROM {self.table_name} WHERE id = ?""", (post_id,))
+        c.close()
+
+    def migrate_images(self, batch_size: int=100) -> dict:
+        r"""move the `IMG_SPLIT_TAG` joined images of `imgs` column into the image store.
+        Run `vacuum` after it to give the space back to disk.
+        """
+        c = self.get_cursor()
+        sql = f"""SELECT id FROM {self.table_name} WHERE imgs IS NOT NULL"""
+        ids = [x[0] for x in c.execute(sql).fetchall()]
+        for i in range(0, len(ids), batch_size):
+            for post_id in ids[i:i+batch_size]:
+                if not self.get_post_images(post_id):
+                    self.add_post_images(post_id, self.get_images(post_id))
+                c.execute(f"""UPDATE {self.table_name} SET imgs = NULL WHERE id = ?""", (post_id,))
+            self.commit()
+        c.close()
+        print(f"[INFO] Table: {self.table_name} migrated images of {len(ids)} posts.")
+        return self.image_stats()
+
+    def image_stats(self) -> dict:
+        r"""number of images and bytes referred by posts and actually stored"""
+        c = self.get_cursor()
+        sql = f"""SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(size * refcount), 0)
+            FROM {self.images_table_name}"""
+        n_stored, stored_bytes, referred_bytes = c.execute(sql).fetchone()
+        n_referred = c.execute(f"""SELECT COUNT(*) FROM {self.post_images_table_name}""").fetchone()[0]
+        c.close()
+        return {"referred_images": n_referred, "stored_images": n_stored,
+            "referred_bytes": referred_bytes, "stored_bytes": stored_bytes,
+            "saved_bytes": referred_bytes - stored_bytes}
+
+    def vacuum(self):
+        self.conn.execute("VACUUM")
 
     def commit(self):
         self.conn.commit()
     
     def close(self):   
+        if self.checkpoint_on_close:
+            self.checkpoint(self.checkpoint_on_close)
         self.conn.close()
 
     def start(self):
-        self.conn = sqlite3.connect(self.db_name)
+        if self.read_only:
+            self.conn = sqlite3.connect(f"file:{self.db_name}?mode=ro", uri=True, timeout=self.busy_timeout / 1000)
+        else:
+            self.conn = sqlite3.connect(self.db_name, timeout=self.busy_timeout / 1000)
+        for name, value in self.pragmas.items():
+            self.conn.execute(f"PRAGMA {name} = {value}")
+        if "page_size" in self.pragmas:
+            page_size = self.get_pragma("page_size")
+            if page_size != self.pragmas["page_size"]:
+                print(f"[INFO] Database: page_size is {page_size}, run `vacuum` without WAL mode to change it")
+
+    def get_pragma(self, name: str):
+        return self.conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+    def checkpoint(self, mode: str="PASSIVE") -> tuple:
+        r"""copy the WAL file back into the database, no effect unless in WAL mode
+
+        Args:
+            mode (str, optional): "PASSIVE" / "FULL" / "RESTART" / "TRUNCATE". Defaults to "PASSIVE".
+
+        Returns:
+            tuple: (busy, pages in WAL, pages checkpointed)
+        """
+        return self.conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+
+    def link_tags(self, pairs: List[Tuple]):
+        """link the stored posts to other tags
+
+        Args:
+            pairs (List[Tuple]): (tag, postlink)
+        """
+        c = self.get_cursor()
+        sql = f"""INSERT OR IGNORE INTO {self.tags_table_name} VALUES (?,?)"""
+        c.executemany(sql, pairs)
+        c.close()
+
+    def get_postlinks(self, tag: Union[str, None]=None) -> set:
+        r"""postlinks of the tag include the linked posts, all postlinks if `tag` is None"""
+        if tag is None:
+            sql = self.get_sql("get_all_postlinks")
+            params = ()
+        else:
+            sql = self.get_sql("get_postlinks")
+            params = (tag, tag)
+        c = self.get_cursor()
+        res = c.execute(sql, params).fetchall()
+        c.close()
+        return set(map(lambda x: x[0], res))
+
+    def get_tags(self) -> list:
+        sql = self.get_sql("get_tags")
+        return self._fetch_column(sql)
+
+    def get_ids(self, tag: str) -> list:
+        r"""sorted ids of the tag include the linked posts"""
+        sql = self.get_sql("get_ids")
+        return self._fetch_column(sql, (tag,))
+
+    def count_posts(self, tag: Union[str, None]=None) -> int:
+        r"""number of posts of the tag include the linked posts, all posts if `tag` is None"""
+        if tag is None:
+            return self._fetch_column(self.get_sql("count_all_posts"))[0]
+        return self._fetch_column(self.get_sql("count_posts"), (tag,))[0]
+
+    def get_id_range(self, tag: str) -> tuple:
+        sql = self.get_sql("get_id_range")
+        c = self.get_cursor()
+        res = c.execute(sql, (tag,)).fetchone()
+        c.close()
+        return res
+
+    def get_next_id(self, tag: str, idx: int) -> Union[int, None]:
+        sql = self.get_sql("get_next_id")
+        return self._fetch_column(sql, (tag, idx))[0]
+
+    def get_prev_id(self, tag: str, idx: int) -> Union[int, None]:
+        sql = self.get_sql("get_prev_id")
+        return self._fetch_column(sql, (tag, idx))[0]
+
+    def _fetch_column(self, sql: str, params: tuple=()) -> list:
+        c = self.get_cursor()
+        res = c.execute(sql, params).fetchall()
+        c.close()
+        return list(map(lambda x: x[0], res))
+
+    def get_post(self, post_id: int) -> Union[tuple, None]:
+        r"""(uid, postlink, post, othertags) of the post"""
+        c = self.get_cursor()
+        res = c.execute(self.get_sql("get_post"), (post_id,)).fetchone()
+        c.close()
+        return res
+
+    def get_posts(self, tag: str, id_range: Union[Tuple[int, int], None]=None) -> sqlite3.Cursor:
+        r"""cursor of (id, postlink, uid, post, othertags, date, likes) of the tag include the linked posts,
+        only the ids in [first, last] of `id_range` if given(in id order)
+        """
+        c = self.get_cursor()
+        if id_range is None:
+            return c.execute(self.get_sql("get_posts"), (tag,))
+        return c.execute(self.get_sql("get_posts_range"), (tag, ) + tuple(id_range))
+
+    def has_search(self) -> bool:
+        sql = f"SELECT COUNT(*) FROM sqlite_master WHERE name='{self.search_table_name}'"
+        return self._fetch_column(sql)[0] > 0
+
+    def search_posts(self, query: str, tag: Union[str, None]=None, order: str="bm25",
+            limit: Union[int, None]=None) -> List[tuple]:
+        r"""full-text search of post text and hashtags
+
+        Args:
+            query (str): FTS5 query, e.g. `cute cat`(both words), `"cute cat"`(phrase), `#food`(hashtag), `cat OR dog`
+            tag (Union[str, None], optional): only the posts of the tag(include the linked posts). Defaults to None.
+            order (str, optional): "bm25"(relevance) / "likes". Defaults to "bm25".
+            limit (Union[int, None], optional): maximum number of posts, all when None. Defaults to None.
+
+        Returns:
+            List[tuple]: (id, bm25 rank(lower is better), likes) in order
+        """
+        if order not in self.SEARCH_ORDERS:
+            raise Exception(f"[Error] Not supported order `{order}`, should be one of {self.SEARCH_ORDERS}")
+        if not self.has_search():
+            raise Exception("[Error] Full-text search is not available, sqlite is built without FTS5")
+        name = "search" + ("_tag" if tag is not None else "") + ("_likes" if order == "likes" else "")
+        match = self.HASHTAG_QUERY_PATTERN.sub(lambda m: m.group(1) or f'"{m.group(2)}"', query)
+        params = (match, ) + ((tag, tag) if tag is not None else ()) + (-1 if limit is None else limit, )
+        c = self.get_cursor()
+        res = c.execute(self.get_sql(name), params).fetchall()
+        c.close()
+        return res
+
+    def search(self, query: str, tag: Union[str, None]=None, order: str="bm25", limit: Union[int, None]=None) -> list:
+        r"""ids of `search_posts`"""
+        return [x[0] for x in self.search_posts(query, tag, order, limit)]
+
+    def get_posts_digest(self, tag: str) -> Iterator[tuple]:
+        r"""(id, digest) of the posts of the tag in id order, the digest changes when any column or image changes.
+        Image BLOBs are not read, their sha256 hashes are digested.
+        """
+        c = self.get_cursor()
+        for row in c.execute(self.get_sql("get_posts_digest"), (tag,)):
+            yield row[0], hashlib.blake2b(repr(row[1:]).encode("utf-8"), digest_size=16).hexdigest()
+        c.close()
+
+    def get_posts_meta(self, tag: str) -> sqlite3.Cursor:
+        r"""cursor of (id, postlink, post, othertags, uid, date, likes, number of images, bytes of images)
+        of the tag include the linked posts, image BLOBs are not read
+        """
+        c = self.get_cursor()
+        return c.execute(self.get_sql("get_posts_meta"), (tag,))
 
     def get_last_id(self):
-        sql = f"""SELECT id FROM {self.table_name}
-            WHERE id = (SELECT MAX(id) FROM {self.table_name})"""
         c = self.get_cursor()
-        res = c.execute(sql).fetchall()
-        return res
\ No newline at end of file
+        res = c.execute(self.get_sql("get_last_id")).fetchall()
+        c.close()
+        return res
+
+
+class DatabaseWriter(Thread):
+    _STOP = object()
+
+    def __init__(self, db_kwargs: dict, max_rows: int=5, max_bytes: int=32*2**20, commit_interval: float=10.0,
+            queue_size: int=100, on_commit: Union[Callable, None]=None):
+        r"""Writer thread that inserts rows from a bounded queue, so the scraper is not blocked by commits.
+        A batch is committed when it has `max_rows` rows or `max_bytes` bytes,
+        or `commit_interval` seconds passed after the last commit.
+        The writer opens its own connection with `db_kwargs`(`db_settings`).
+
+        Args:
+            db_kwargs (dict): arguments of `Database`(or `ShardedDatabase`)
+            max_rows (int, optional): maximum rows of a batch. Defaults to 5.
+            max_bytes (int, optional): maximum bytes of a batch. Defaults to 32MB.
+            commit_interval (float, optional): maximum seconds between commits. Defaults to 10.0.
+            queue_size (int, optional): maximum rows waiting in queue, `put` blocks when it is full. Defaults to 100.
+            on_commit (Union[Callable, None], optional): called with the committed batch in writer thread. Defaults to None.
+        """
+        super().__init__(daemon=True)
+        self.db_kwargs = db_kwargs
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.commit_interval = commit_interval
+        self.on_commit = on_commit
+        self.queue = Queue(maxsize=queue_size)
+        self.error = None
+        # metrics
+        self.metrics = {"rows": 0, "bytes": 0, "commits": 0,
+            "producer_blocked": 0.0, "writer_idle": 0.0, "writer_busy": 0.0}
+
+    def put(self, row: list):
+        r"""called by scraper, blocks when the queue is full(backpressure)"""
+        if self.error is not None:
+            raise self.error
+        start = time.perf_counter()
+        self._put(row)
+        self.metrics["producer_blocked"] += time.perf_counter() - start
+
+    def close(self):
+        r"""insert remaining rows and wait for the writer"""
+        if self.is_alive():
+            self._put(self._STOP)
+            self.join()
+        if self.error is not None:
+            raise self.error
+        self.report()
+
+    def _put(self, item):
+        while True:
+            try:
+                self.queue.put(item, timeout=1.0)
+                return
+            except Full:
+                if self.error is not None:
+                    raise self.error
+
+    def report(self):
+        m = self.metrics
+        print(f"[INFO] Writer: {m['rows']} rows / {m['bytes']/2**20:.1f}MB in {m['commits']} commits")
+        print(f"[INFO] Writer: scraper blocked {m['producer_blocked']:.1f}s / writer idle {m['writer_idle']:.1f}s, busy {m['writer_busy']:.1f}s")
+
+    def run(self):
+        from .sharding import open_database
+        db = open_database(**self.db_kwargs)
+        batch, batch_bytes = [], 0
+        last_commit = time.perf_counter()
+        try:
+            while True:
+                timeout = max(self.commit_interval - (time.perf_counter() - last_commit), 0.0)
+                start = time.perf_counter()
+                try:
+                    row = self.queue.get(timeout=timeout)
+                except Empty:
+                    row = None
+                self.metrics["writer_idle"] += time.perf_counter() - start
+                if row is self._STOP:
+                    break
+                if row is not None:
+                    batch.append(row)
+                    batch_bytes += self.row_bytes(row)
+                if len(batch) >= self.max_rows or batch_bytes >= self.max_bytes \
+                        or time.perf_counter() - last_commit >= self.commit_interval:
+                    self._write(db, batch, batch_bytes)
+                    batch, batch_bytes = [], 0
+                    last_commit = time.perf_counter()
+            self._write(db, batch, batch_bytes)
+        except Exception as e:
+            self.error = e
+        finally:
+            db.close()
+
+    def _write(self, db: "Database", batch: list, batch_bytes: int):
+        if not batch:
+            return
+        start = time.perf_counter()
+        db.ingest(batch)
+        self.metrics["writer_busy"] += time.perf_counter() - start
+        self.metrics["rows"] += len(batch)
+        self.metrics["bytes"] += batch_bytes
+        self.metrics["commits"] += 1
+        if self.on_commit is not None:
+            self.on_commit(batch)
+
+    @staticmethod
+    def row_bytes(row: list) -> int:
+        n_bytes = 0
+        for x in row:
+            if isinstance(x, (bytes, str)):
+                n_bytes += len(x)
+            elif isinstance(x, list):
+                n_bytes += sum(sum(map(len, img)) if isinstance(img, tuple) else len(img) for img in x)
+        return n_bytes
+
@@ -0,0 +1,110 @@
+import http.client
+from urllib import parse
+from threading import Lock, BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor, Future
+
+class ImageDownloader:
+    MAX_REDIRECTS = 3
+    RETRY_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+    def __init__(self, max_workers: int=8, max_per_host: int=4, timeout: float=10):
+        r"""Download images in background threads, keep-alive connections are pooled per host.
+
+        Args:
+            max_workers (int, optional): number of download threads. Defaults to 8.
+            max_per_host (int, optional): maximum concurrent connections to one host. Defaults to 4.
+            timeout (float, optional): socket timeout in seconds. Defaults to 10.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self._lock = Lock()
+        self._idle = {}  # (scheme, netloc): idle connections
+        self._limits = {}  # (scheme, netloc): semaphore
+
+    def submit(self, url: str) -> Future:
+        return self.executor.submit(self.fetch, url)
+
+    def fetch(self, url: str) -> bytes:
+        for _ in range(self.MAX_REDIRECTS + 1):
+            status, location, body = self.request(url)
+            if status in (301, 302, 303, 307, 308) and location:
+                url = parse.urljoin(url, location)
+                continue
+            if status != 200:
+                raise Exception(f"[Error] HTTP {status}: {url}")
+            return body
+        raise Exception(f"[Error] Too many redirects: {url}")
+
+    def request(self, url: str, headers: dict=None) -> tuple:
+        """send a GET request through a pooled connection
+
+        Args:
+            url (str): absolute url
+            headers (dict, optional): request headers. Defaults to None.
+
+        Returns:
+            tuple: (status, location header, body)
+        """
+        parsed = parse.urlsplit(url)
+        key = (parsed.scheme, parsed.netloc)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += f"?{parsed.query}"
+        with self._get_limit(key):
+            conn, reused = self._get_conn(key)
+            try:
+                conn.request("GET", path, headers=headers or {})
+                res = conn.getresponse()
+            except self.RETRY_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                # idle keep-alive connection was closed by server, retry once
+                conn = self._new_conn(key)
+                try:
+                    conn.request("GET", path, headers=headers or {})
+                    res = conn.getresponse()
+                except Exception:
+                    conn.close()
+                    raise
+            except Exception:
+                conn.close()
+                raise
+            body = res.read()
+            if res.will_close:
+                conn.close()
+            else:
+                self._put_conn(key, conn)
+        return res.status, res.getheader("Location"), body
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle = {}
+
+    def _get_limit(self, key: tuple) -> BoundedSemaphore:
+        with self._lock:
+            if key not in self._limits:
+                self._limits[key] = BoundedSemaphore(self.max_per_host)
+            return self._limits[key]
+
+    def _get_conn(self, key: tuple) -> tuple:
+        with self._lock:
+            conns = self._idle.get(key)
+            if conns:
+                return conns.pop(), True
+        return self._new_conn(key), False
+
+    def _put_conn(self, key: tuple, conn: http.client.HTTPConnection):
+        with self._lock:
+            self._idle.setdefault(key, []).append(conn)
+
+    def _new_conn(self, key: tuple) -> http.client.HTTPConnection:
+        scheme, netloc = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
@@ -0,0 +1,131 @@
+import io
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, Tuple, Iterable, Iterator
+from PIL import Image, ImageOps
+
+def make_thumbnail(img: bytes, size: int=640, quality: int=85) -> Union[Tuple[bytes, int, int], None]:
+    r"""JPEG thumbnail that fits in `size` x `size` with the aspect ratio kept
+
+    Args:
+        img (bytes): original image
+        size (int, optional): maximum width and height. Defaults to 640.
+        quality (int, optional): JPEG quality. Defaults to 85.
+
+    Returns:
+        Union[Tuple[bytes, int, int], None]: (JPEG bytes, width, height), None if the image can not be decoded
+    """
+    try:
+        with Image.open(io.BytesIO(img)) as im:
+            # JPEG is decoded at reduced scale when it is much larger than `size`
+            im.draft("RGB", (size, size))
+            im = im.convert("RGB")
+            im.thumbnail((size, size))
+            buffer = io.BytesIO()
+            im.save(buffer, format="JPEG", quality=quality)
+            return buffer.getvalue(), im.width, im.height
+    except (OSError, ValueError):
+        return None
+
+def decode_resized(img: bytes, size: Tuple[int, int]=(224, 224)) -> Union[Image.Image, None]:
+    r"""decode into an RGB image of exactly `size`(width, height), center cropped to the aspect ratio of `size`
+
+    Args:
+        img (bytes): encoded image
+        size (Tuple[int, int], optional): (width, height). Defaults to (224, 224).
+
+    Returns:
+        Union[Image.Image, None]: RGB image, None if the image can not be decoded
+    """
+    try:
+        with Image.open(io.BytesIO(img)) as im:
+            # JPEG is decoded at reduced scale when it is much larger than `size`
+            im.draft("RGB", size)
+            return ImageOps.fit(im.convert("RGB"), size, Image.BICUBIC)
+    except (OSError, ValueError):
+        return None
+
+def transcode(img: bytes, fmt: str="webp", quality: int=80, max_size: Union[int, None]=None) -> bytes:
+    r"""re-encode the image into `fmt`, downscaled to fit in `max_size` x `max_size`.
+    The original is returned when it can not be decoded, or when it is smaller and needs no downscale.
+
+    Args:
+        img (bytes): original image
+        fmt (str, optional): "webp" / "jpeg". Defaults to "webp".
+        quality (int, optional): quality of the encoder. Defaults to 80.
+        max_size (Union[int, None], optional): maximum width and height, keep the size when None. Defaults to None.
+
+    Returns:
+        bytes: transcoded image
+    """
+    try:
+        with Image.open(io.BytesIO(img)) as im:
+            resize = max_size is not None and max(im.size) > max_size
+            if resize:
+                im.draft("RGB", (max_size, max_size))
+            im = im.convert("RGB")
+            if resize:
+                im.thumbnail((max_size, max_size))
+            buffer = io.BytesIO()
+            im.save(buffer, format=fmt.upper(), quality=quality)
+    except (OSError, ValueError):
+        return img
+    res = buffer.getvalue()
+    return res if resize or len(res) < len(img) else img
+
+class Transcoder:
+    def __init__(self, fmt: str="webp", quality: int=80, max_size: Union[int, None]=None,
+            keep_original: bool=False, workers: int=2, max_pending: int=16):
+        r"""Transcode the images of scraped rows in a process pool, the scraper keeps going meanwhile.
+
+        Args:
+            fmt (str, optional): "webp" / "jpeg". Defaults to "webp".
+            quality (int, optional): quality of the encoder. Defaults to 80.
+            max_size (Union[int, None], optional): maximum width and height. Defaults to None.
+            keep_original (bool, optional): also store the original bytes. Defaults to False.
+            workers (int, optional): number of processes. Defaults to 2.
+            max_pending (int, optional): rows being transcoded, the scraper waits when exceeded. Defaults to 16.
+        """
+        self.fmt = fmt
+        self.quality = quality
+        self.max_size = max_size
+        self.keep_original = keep_original
+        self.max_pending = max_pending
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.metrics = {"images": 0, "original_bytes": 0, "transcoded_bytes": 0}
+
+    def submit(self, imgs: list):
+        n = len(imgs)
+        return self.executor.map(transcode, imgs, [self.fmt] * n, [self.quality] * n, [self.max_size] * n)
+
+    def map_rows(self, rows: Iterable[list], img_idx: int) -> Iterator[list]:
+        r"""transcode `row[img_idx]`(list of image bytes) of the rows in order.
+        Images become (transcoded, original) when `keep_original`, so `Database.insert` stores both.
+        """
+        pending = deque()
+        for row in rows:
+            pending.append((row, self.submit(row[img_idx])))
+            while pending and (len(pending) > self.max_pending):
+                yield self._resolve(*pending.popleft(), img_idx)
+        while pending:
+            yield self._resolve(*pending.popleft(), img_idx)
+
+    def _resolve(self, row: list, results, img_idx: int) -> list:
+        imgs = row[img_idx]
+        transcoded = list(results)
+        self.metrics["images"] += len(imgs)
+        self.metrics["original_bytes"] += sum(len(img) for img in imgs)
+        self.metrics["transcoded_bytes"] += sum(len(img) for img in transcoded)
+        if self.keep_original:
+            transcoded = [(t, img) if t != img else t for t, img in zip(transcoded, imgs)]
+        row = list(row)
+        row[img_idx] = transcoded
+        return row
+
+    def report(self):
+        m = self.metrics
+        if m["images"]:
+            print(f"[INFO] Transcode: {m['images']} images, {m['original_bytes']/2**20:.1f}MB -> {m['transcoded_bytes']/2**20:.1f}MB")
+
+    def close(self):
+        self.executor.shutdown()
@@ -1,18 +1,46 @@
 import os
 import re
+import json
 import bs4
-from typing import Union
+import http.client
+from typing import Union, Callable
 from tqdm import tqdm
-from time import sleep
 from urllib import parse
-from bs4 import BeautifulSoup
 from selenium import webdriver
-from urllib.request import urlopen
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import NoSuchElementException, TimeoutException
 from selenium.webdriver.support import expected_conditions as EC
 from typing import Generator
+from collections import deque
+from queue import Queue, Empty
+from threading import Thread, Condition, Event
+from concurrent.futures import ThreadPoolExecutor
+from .downloader import ImageDownloader
+from .waits import PageWaiter
+from .parser import PostParser
+
+# returns [href, has video/slides label, aria-label] of post anchors that are not harvested yet
+# and the number of recent post rows(-1 if there is no recent post section)
+HARVEST_LINKS_SCRIPT = """
+var posts = [];
+var rows = document.getElementsByClassName(arguments[0]);
+for (var i = 0; i < rows.length; i++) {
+    var anchors = rows[i].getElementsByTagName("a");
+    for (var j = 0; j < anchors.length; j++) {
+        var a = anchors[j];
+        var href = a.getAttribute("href");
+        // react may reuse the element for another post, so remember the href
+        if (a.dataset.spiderSeen === href) continue;
+        a.dataset.spiderSeen = href;
+        var label = a.getElementsByClassName(arguments[1]);
+        var span = label.length ? label[0].querySelector("span") : null;
+        posts.push([href, label.length > 0, span ? span.getAttribute("aria-label") : null]);
+    }
+}
+var recent = document.querySelector(arguments[2]);
+return [posts, recent ? recent.getElementsByClassName(arguments[0]).length : -1];
+"""
 
 class Instagram:
     DRIVER_WAIT_TIME = 10
@@ -41,6 +69,16 @@ class Instagram:
     LOGIN_ID_XPATH = '//*[@id="loginForm"]/div/div[1]/div/label/input'
     LOGIN_PW_XPATH = '//*[@id="loginForm"]/div/div[2]/div/label/input'
     IMG_SPLIT_TAG = b"<IMG>"
+    BASE_URL = "https://www.instagram.com"
+    EMBEDDED_DATA_PATTERNS = [
+        re.compile(r"window\.__additionalDataLoaded\(\s*['\"][^'\"]*['\"]\s*,\s*"),
+        re.compile(r"window\._sharedData\s*=\s*"),
+    ]
+    # only the elements with these classes(and their children) are parsed
+    PARSE_CLASSES = [
+        ATTRS_POSTS, ATTRS_USER_ID, ATTRS_DATE, ATTRS_POST_TEXT, ATTRS_LIKES, ATTRS_IMG,
+        ATTRS_TAGS, ATTRS_ARIA_LABEL, ATTRS_POST_LIST, ATTRS_SAVE_INFO, ATTRS_ALRAM_OFF
+    ]
 
     def __init__(self, **kwargs):
         if os.name == "nt":
@@ -61,6 +99,19 @@ class Instagram:
 
         self.driver = webdriver.Chrome(chrome_p, options=options)
         self.thres_links = kwargs["thres_links"]
+        self.parser = PostParser(kwargs.get("parser", self.PARSER), self.PARSE_CLASSES)
+        self.waiter = PageWaiter(self.driver, self.SLEEP_TIME,
+            mode=kwargs.get("wait_mode", "event"),
+            quiet_ms=kwargs.get("wait_quiet_ms", 300)
+        )
+        # image downloads run in background, can be shared between drivers
+        self.downloader = kwargs.get("downloader") or ImageDownloader(
+            max_workers=kwargs.get("download_workers", 8),
+            max_per_host=kwargs.get("download_per_host", 4)
+        )
+        # post pages can be fetched over http with the cookies of the driver after login
+        self.fetch_mode = kwargs.get("fetch_mode", "browser")
+        self.fetcher = PostFetcher(self.downloader, self.parser, self.BASE_URL)
         # Force to login: if kwargs["login"]:
         print("[INFO] Trying to Login...")
         # TODO: 
@@ -71,6 +122,9 @@ class Instagram:
         self.login(insta_id, insta_pw)
             
         print("[INFO] Login Done!")
+        if self.fetch_mode == "http":
+            self.fetcher.set_session(self.driver.get_cookies(),
+                self.driver.execute_script("return navigator.userAgent"))
 
     def login(self, insta_id: str, insta_pw: str):
         r"""login to instagram
@@ -81,7 +135,7 @@ class Instagram:
         """      
         login_url = "https://www.instagram.com/accounts/login/?source=auth_switcher"
         self.driver.get(login_url)
-        sleep(self.SLEEP_TIME)
+        self.waiter.wait()
         try:
             self.INSTA_SCROLL_POST_XPATH
             username_box_check = WebDriverWait(self.driver, self.DRIVER_WAIT_TIME).until(
@@ -96,7 +150,8 @@ class Instagram:
         pw_input = self.driver.find_element(By.XPATH, self.LOGIN_PW_XPATH)
         pw_input.send_keys(insta_pw)
         pw_input.submit()
-        sleep(5)
+        self.waiter.wait(condition=lambda d: "accounts/login" not in d.current_url,
+            baseline=5, timeout=self.DRIVER_WAIT_TIME)
 
         soup = self.get_soup()
         if soup.find_all(attrs={"class": self.ATTRS_SAVE_INFO}):
@@ -118,12 +173,12 @@ class Instagram:
 
     def get_soup(self) -> bs4.BeautifulSoup:
         webpage = self.driver.page_source
-        soup = BeautifulSoup(webpage, self.PARSER)
+        soup = self.parser.parse(webpage)
         return soup
 
     def get_link(self, url: str):
         self.driver.get(url)
-        sleep(self.SLEEP_TIME)
+        self.waiter.wait()
 
     def exists_xpath(self, xpath: str):
         try:
@@ -134,10 +189,17 @@ class Instagram:
 
     def click_button(self, xpath: str):    
         self.driver.find_element(By.XPATH, xpath).click()
-        sleep(self.SLEEP_TIME)
+        self.waiter.wait()
+
+    def scroll_down(self, last_height: int):
+        self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        self.waiter.wait(
+            condition=lambda d: d.execute_script("return document.body.scrollHeight") != last_height
+        )
 
     def close(self):
         self.driver.close()
+        self.downloader.close()
         print("[INFO] driver closed")
 
     def collect_links(self, tag: str) -> list:
@@ -149,7 +211,6 @@ class Instagram:
         Returns:
             list: links of posts
         """
-        links = []
         url = f"https://www.instagram.com/explore/tags/{self.parse_tag(tag)}/"
         self.get_link(url)
         try:
@@ -160,41 +221,35 @@ class Instagram:
             print(f"[INFO] Waiting for loading {url}")
 
         pbar = tqdm(total=self.thres_links)
-
+        # dict keeps insertion order, works as an ordered set
+        links = {}
         while len(links) < self.thres_links:
-            soup = self.get_soup()
-            posts = list(soup.find_all(name="div", attrs={"class": self.ATTRS_POSTS}))
-            for link in posts:
-                for post in link.select("a"):
-                    if post.attrs["href"] in links:
-                        continue
-                    if len(links) >= self.thres_links:
-                        break
-                    # skip all videos
-                    exists_label = post.find_all(attrs={"class": self.ATTRS_ARIA_LABEL})
-                    is_slides = exists_label[0].find("span").attrs["aria-label"] == "슬라이드" if exists_label else False
-                    if not exists_label or is_slides:
-                        l = post.attrs["href"]
-                        links.append(l)
-                        pbar.update(1)
-
-            scroll_contin = soup.select(self.INSTA_SCROLL_POST_CSS)
-            if scroll_contin:
-                recent_row_length = len(scroll_contin[0].find_all(
-                    attrs={"class": self.ATTRS_POSTS}))
+            # only anchors that appeared after last scroll are returned
+            new_posts, recent_row_length = self.driver.execute_script(
+                HARVEST_LINKS_SCRIPT, self.ATTRS_POSTS, self.ATTRS_ARIA_LABEL, self.INSTA_SCROLL_POST_CSS)
+            for href, exists_label, aria_label in new_posts:
+                if href in links:
+                    continue
+                if len(links) >= self.thres_links:
+                    break
+                # skip all videos
+                is_slides = aria_label == "슬라이드" if exists_label else False
+                if not exists_label or is_slides:
+                    links[href] = None
+                    pbar.update(1)
+
+            if recent_row_length >= 0:
                 pbar.set_description(f"Recent Posts Length: {recent_row_length}")
             else:
                 # if no recent post. break 
                 break
 
             last_height = self.driver.execute_script("return document.body.scrollHeight")
-            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            sleep(self.SLEEP_TIME)
+            self.scroll_down(last_height)
             new_height = self.driver.execute_script("return document.body.scrollHeight")
 
             if new_height == last_height:
-                self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                sleep(self.SLEEP_TIME)
+                self.scroll_down(last_height)
                 new_height = self.driver.execute_script("return document.body.scrollHeight")
 
                 if new_height == last_height:
@@ -207,14 +262,13 @@ class Instagram:
                     last_height = new_height
                     continue
         pbar.close()
-        return links
+        return list(links)
 
     def get_byte_img(self, img_link):
-        with urlopen(img_link) as img_reader:
-            img_byte = img_reader.read()
-        return img_byte
+        return self.downloader.fetch(img_link)
 
-    def get_img(self, soup: bs4.BeautifulSoup, idx: int) -> Union[str, list]:
+    @classmethod
+    def get_img(cls, soup: bs4.BeautifulSoup, idx: int) -> Union[str, list]:
         """return img source, if no <img> tag will return empty list
         if the post_list is empty, means only have single image
         else means having multiple images
@@ -226,14 +280,15 @@ class Instagram:
         Returns:
             Union[str, list]: img source link or empty list 
         """        
-        post_list = soup.find_all(attrs={"class": self.ATTRS_POST_LIST})
+        post_list = soup.find_all(attrs={"class": cls.ATTRS_POST_LIST})
         if post_list:
-            img_link = self.get_img_from_post_div(post_list[idx])
+            img_link = cls.get_img_from_post_div(post_list[idx])
         else:
-            img_link = soup.find_all(attrs={"class": self.ATTRS_IMG})[0]["src"]
+            img_link = soup.find_all(attrs={"class": cls.ATTRS_IMG})[0]["src"]
         return img_link
 
-    def get_img_from_post_div(self, post_div: bs4.element.Tag) -> Union[str, list]:
+    @classmethod
+    def get_img_from_post_div(cls, post_div: bs4.element.Tag) -> Union[str, list]:
         """return img source, if no <img> tag will return empty list
 
         Args:
@@ -242,99 +297,411 @@ class Instagram:
         Returns:
             Union[str, list]: img source link or empty list 
         """        
-        x = post_div.find_all(attrs={"class": self.ATTRS_IMG})
+        x = post_div.find_all(attrs={"class": cls.ATTRS_IMG})
         if x:
             return x[0]["src"]
         else:
             return x
 
-    def get_data(self, links: list) -> Generator:
-        for i in range(len(links)):
-            post_link = f"https://www.instagram.com{links[i]}"
-            self.get_link(post_link)
-            try:
-                img_loaded_check = WebDriverWait(self.driver, self.DRIVER_WAIT_TIME).until(
-                    EC.presence_of_element_located((By.CLASS_NAME, self.ATTRS_IMG))
-                )
-            except:
-                print(f"[WARNING] Not exists: {post_link}")
-                continue
-                # raise Exception("Cannot find XPATH, set `DRIVER_WAIT_TIME` longer")
+    def click_carousel(self, soup: bs4.BeautifulSoup) -> tuple:
+        """click through the slides of the post and collect the image links, videos are skipped
 
-            soup = self.get_soup()
-
-            # user_id
-            user_id = soup.find_all(attrs={"class": self.ATTRS_USER_ID})[0].text
+        Args:
+            soup (bs4.BeautifulSoup): soup object of post page
 
-            # date
-            date = soup.find_all(attrs={"class": self.ATTRS_DATE})[0].find("time").get("datetime")[:10]
-            
-            
-            # likes
-            x = soup.find_all(attrs={"class": self.ATTRS_LIKES})
-            number_text = re.findall("[0-9]", x[0].text) if x else False
-            if number_text:
-                likes = int("".join(number_text))
-            else:
-                likes = -1
-            
-            # imgs
-            # TODO: bug, cannot find the class element when we make the window smallest
-            img_link = self.get_img(soup=soup, idx=0)
-            # create image container, if first image is video, will create empty list
-            imgs = [self.get_byte_img(img_link)] if img_link else img_link
-            if self.exists_xpath(self.INSTA_FIRST_BTN_XPATH):
-                self.click_button(self.INSTA_FIRST_BTN_XPATH)
+        Returns:
+            tuple: (image links, soup object of the last slide)
+        """
+        # TODO: bug, cannot find the class element when we make the window smallest
+        img_link = self.get_img(soup=soup, idx=0)
+        # create image container, if first image is video, will create empty list
+        img_links = [img_link] if img_link else img_link
+        if self.exists_xpath(self.INSTA_FIRST_BTN_XPATH):
+            self.click_button(self.INSTA_FIRST_BTN_XPATH)
+            soup = self.get_soup()
+            img_link = self.get_img(soup=soup, idx=1)
+            if img_link:
+                img_links.append(img_link)
+            while self.exists_xpath(self.INSTA_NEXT_BTN_XPATH):
+                self.click_button(self.INSTA_NEXT_BTN_XPATH)
                 soup = self.get_soup()
                 img_link = self.get_img(soup=soup, idx=1)
                 if img_link:
-                    imgs.append(self.get_byte_img(img_link))
-                while self.exists_xpath(self.INSTA_NEXT_BTN_XPATH):
-                    self.click_button(self.INSTA_NEXT_BTN_XPATH)
-                    soup = self.get_soup()
-                    img_link = self.get_img(soup=soup, idx=1)
-                    if img_link:
-                        imgs.append(self.get_byte_img(img_link))
-
-            if len(imgs) == 0:
-                continue
-            else:
-                imgs = self.IMG_SPLIT_TAG.join(imgs)
-
-            # Treat all self comment as post, do not open other id's comment
-            f_get_text = lambda html_div: " ".join([html.get_text(separator=" ").strip() for html in list(html_div)[1:-1]])
-            x = soup.find_all(attrs={"class": self.ATTRS_POST_TEXT})
-            post_text = ""
-            if x:
-                for i, html_div in enumerate(x):
-                    if html_div.find("a").text == user_id:
-                        if i == 0:
-                            continue
-                        if i == 1:
-                            x_path = self.INSTA_POST_REPLY_XPATH.format("")
-                        else:
-                            x_path = self.INSTA_POST_REPLY_XPATH.format(f"[{i}]")
-                        if self.exists_xpath(x_path):
-                            self.click_button(x_path)
-                # post text
-                soup = self.get_soup()
-                x = soup.find_all(attrs={"class": self.ATTRS_POST_TEXT})
-                for html_div in x:
-                    if list(html_div)[0].get_text() == user_id:
-                        post_text += f_get_text(html_div).replace(f"@{user_id}", "")
-                # othertags
-                x = soup.find_all(attrs={"class": self.ATTRS_TAGS})
-                if x:
-                    othertags = " ".join([t.text for t in x])
-                else:
-                    othertags = " "
+                    img_links.append(img_link)
+        return img_links, soup
+
+    @classmethod
+    def get_carousel_links(cls, webpage: str, link: Union[str, None]=None) -> Union[list, None]:
+        """read the image links of every slide from the data embedded in the page, videos are skipped
+
+        Args:
+            webpage (str): html of post page
+            link (Union[str, None], optional): post link, check the data belongs to the post. Defaults to None.
+
+        Returns:
+            Union[list, None]: image links, None if there is no embedded data
+        """
+        media = cls.get_shortcode_media(webpage)
+        if media is None:
+            return None
+        if link is not None and media.get("shortcode") and f"/{media['shortcode']}/" not in link:
+            return None
+        if "edge_sidecar_to_children" in media:
+            nodes = [edge["node"] for edge in media["edge_sidecar_to_children"]["edges"]]
+        else:
+            nodes = [media]
+        try:
+            return [node["display_url"] for node in nodes if not node.get("is_video")]
+        except KeyError:
+            return None
+
+    @classmethod
+    def get_shortcode_media(cls, webpage: str) -> Union[dict, None]:
+        decoder = json.JSONDecoder()
+        for pattern in cls.EMBEDDED_DATA_PATTERNS:
+            for m in pattern.finditer(webpage):
+                try:
+                    data, _ = decoder.raw_decode(webpage, m.end())
+                except ValueError:
+                    continue
+                media = cls._find_key(data, "shortcode_media")
+                if media:
+                    return media
+        return None
+
+    @classmethod
+    def _find_key(cls, data: Union[dict, list], key: str):
+        if isinstance(data, dict):
+            if key in data:
+                return data[key]
+            values = data.values()
+        elif isinstance(data, list):
+            values = data
+        else:
+            return None
+        for v in values:
+            x = cls._find_key(v, key)
+            if x is not None:
+                return x
+        return None
+
+    def record_fixture(self, link: str, path: Union[str, os.PathLike]):
+        """save the post page and the image links from clicking through the slides,
+        can be used to verify `get_carousel_links`
+
+        Args:
+            link (str): post link, e.g. '/p/xxxx/'
+            path (Union[str, os.PathLike]): path without suffix, '.html' and '.links.txt' will be saved
+        """
+        self.get_link(f"{self.BASE_URL}{link}")
+        webpage = self.driver.page_source
+        img_links, _ = self.click_carousel(self.parser.parse(webpage))
+        with open(f"{path}.html", "w", encoding="utf-8") as file:
+            file.write(webpage)
+        with open(f"{path}.links.txt", "w", encoding="utf-8") as file:
+            for l in img_links:
+                print(l, file=file)
+
+    @classmethod
+    def parse_post_info(cls, soup: bs4.BeautifulSoup) -> tuple:
+        """parse the user id, date and likes of the post
+
+        Args:
+            soup (bs4.BeautifulSoup): soup object of post page
+
+        Returns:
+            tuple: (user_id, date, likes), likes is -1 if not exists
+        """
+        # user_id
+        user_id = soup.find_all(attrs={"class": cls.ATTRS_USER_ID})[0].text
+
+        # date
+        date = soup.find_all(attrs={"class": cls.ATTRS_DATE})[0].find("time").get("datetime")[:10]
+
+        # likes
+        x = soup.find_all(attrs={"class": cls.ATTRS_LIKES})
+        number_text = re.findall("[0-9]", x[0].text) if x else False
+        if number_text:
+            likes = int("".join(number_text))
+        else:
+            likes = -1
+        return user_id, date, likes
+
+    @classmethod
+    def parse_post_text(cls, soup: bs4.BeautifulSoup, user_id: str) -> tuple:
+        """parse the post text(all comments of the user) and the hashtags of the post
+
+        Args:
+            soup (bs4.BeautifulSoup): soup object of post page, after the replies are opened
+            user_id (str): user id of the post
+
+        Returns:
+            tuple: (post_text, othertags)
+        """
+        f_get_text = lambda html_div: " ".join([html.get_text(separator=" ").strip() for html in list(html_div)[1:-1]])
+        x = soup.find_all(attrs={"class": cls.ATTRS_POST_TEXT})
+        if not x:
+            return " ", " "
+        # post text
+        post_text = ""
+        for html_div in x:
+            if list(html_div)[0].get_text() == user_id:
+                post_text += f_get_text(html_div).replace(f"@{user_id}", "")
+        # othertags
+        x = soup.find_all(attrs={"class": cls.ATTRS_TAGS})
+        if x:
+            othertags = " ".join([t.text for t in x])
+        else:
+            othertags = " "
+        return post_text, othertags
+
+    def get_data(self, links: list, on_skip: Union[Callable, None]=None) -> Generator:
+        """scrape posts of the links
+
+        Args:
+            links (list): post links
+            on_skip (Union[Callable, None], optional): called with the link when the post is skipped. Defaults to None.
+
+        Yields:
+            list: [postlink, post, imgs, othertags, uid, date, likes], imgs is a list of image bytes
+        """
+        # browser moves to next post while images are downloading,
+        # the post will be yielded only when all of its images are arrived
+        pending = deque()
+        for link in links:
+            data = self.get_post(link)
+            if data is not None:
+                pending.append(data)
+            elif on_skip is not None:
+                on_skip(link)
+            while pending and self.is_downloaded(pending[0]):
+                yield self.finish_post(pending.popleft())
+        while pending:
+            yield self.finish_post(pending.popleft())
+        self.waiter.report()
+
+    def is_downloaded(self, data: list) -> bool:
+        return all(f.done() for f in data[2])
+
+    def finish_post(self, data: list) -> list:
+        r"""wait for the image downloads of `get_post` result"""
+        data[2] = [f.result() for f in data[2]]
+        return data
+
+    def get_post(self, link: str) -> Union[list, None]:
+        """scrape a single post, return `None` if the post cannot be loaded or only has videos
+
+        Args:
+            link (str): post link, e.g. '/p/xxxx/'
+
+        Returns:
+            Union[list, None]: [postlink, post, imgs, othertags, uid, date, likes]
+                imgs is a list of download futures, use `finish_post` to get the bytes
+        """
+        if self.fetch_mode == "http":
+            data = self.fetcher.fetch(link)
+            if data is not None:
+                return data
+            # fall back to the driver when the page cannot be parsed
+        self.waiter.start_post()
+        try:
+            return self._get_post(link)
+        finally:
+            self.waiter.end_post()
+
+    def _get_post(self, link: str) -> Union[list, None]:
+        post_link = f"{self.BASE_URL}{link}"
+        self.get_link(post_link)
+        try:
+            img_loaded_check = WebDriverWait(self.driver, self.DRIVER_WAIT_TIME).until(
+                EC.presence_of_element_located((By.CLASS_NAME, self.ATTRS_IMG))
+            )
+        except:
+            print(f"[WARNING] Not exists: {post_link}")
+            return None
+            # raise Exception("Cannot find XPATH, set `DRIVER_WAIT_TIME` longer")
+
+        webpage = self.driver.page_source
+        soup = self.parser.parse(webpage)
+
+        user_id, date, likes = self.parse_post_info(soup)
+
+        # imgs
+        # read all slides from embedded page data at once, click through the slides if not exists
+        img_links = self.get_carousel_links(webpage, link)
+        if img_links is None:
+            img_links, soup = self.click_carousel(soup)
+        imgs = [self.downloader.submit(img_link) for img_link in img_links]
+
+        if len(imgs) == 0:
+            return None
+
+        # Treat all self comment as post, do not open other id's comment
+        x = soup.find_all(attrs={"class": self.ATTRS_POST_TEXT})
+        if x:
+            for i, html_div in enumerate(x):
+                if html_div.find("a").text == user_id:
+                    if i == 0:
+                        continue
+                    if i == 1:
+                        x_path = self.INSTA_POST_REPLY_XPATH.format("")
+                    else:
+                        x_path = self.INSTA_POST_REPLY_XPATH.format(f"[{i}]")
+                    if self.exists_xpath(x_path):
+                        self.click_button(x_path)
+            soup = self.get_soup()
+        post_text, othertags = self.parse_post_text(soup, user_id)
+
+        # (... postlink TEXT, post TEXT, imgs TEXT, othertags TEXT, uid INTEGER, date TEXT, likes INTEGER)
+        temp = [
+            link, post_text, imgs, othertags, user_id, date, likes
+        ]
+        return temp
+
+
+class PostFetcher:
+    def __init__(self, downloader: ImageDownloader, parser: PostParser, base_url: str=Instagram.BASE_URL):
+        r"""Fetch post pages over pooled http connections instead of the browser,
+        the session cookies are exported from the logged-in driver.
+        The page is parsed with same parser and same fields as `Instagram.get_post`,
+        the replies of the post cannot be opened without browser.
+
+        Args:
+            downloader (ImageDownloader): pooled http client, also downloads the images
+            parser (PostParser): post parser
+            base_url (str, optional): base url of the post links. Defaults to "https://www.instagram.com".
+        """
+        self.downloader = downloader
+        self.parser = parser
+        self.base_url = base_url
+        self.headers = {}
+
+    def set_session(self, cookies: list, user_agent: Union[str, None]=None):
+        """use the session of the driver
+
+        Args:
+            cookies (list): cookies from `driver.get_cookies()`
+            user_agent (Union[str, None], optional): user agent of the driver. Defaults to None.
+        """
+        self.headers = {"Cookie": "; ".join(f"{c['name']}={c['value']}" for c in cookies)}
+        if user_agent:
+            self.headers["User-Agent"] = user_agent
+
+    def fetch(self, link: str) -> Union[list, None]:
+        """fetch and parse a single post, return `None` if failed
+
+        Args:
+            link (str): post link, e.g. '/p/xxxx/'
+
+        Returns:
+            Union[list, None]: same as `Instagram.get_post`
+        """
+        try:
+            status, _, body = self.downloader.request(f"{self.base_url}{link}", headers=self.headers)
+        except (OSError, http.client.HTTPException):
+            # e.g. IncompleteRead, BadStatusLine are not OSError, the post falls back to the driver
+            return None
+        if status != 200:
+            return None
+        webpage = body.decode("utf-8", errors="replace")
+        soup = self.parser.parse(webpage)
+        try:
+            user_id, date, likes = Instagram.parse_post_info(soup)
+            img_links = Instagram.get_carousel_links(webpage, link)
+            if img_links is None:
+                return None
+            post_text, othertags = Instagram.parse_post_text(soup, user_id)
+        except (IndexError, KeyError, AttributeError, TypeError):
+            return None
+        imgs = [self.downloader.submit(img_link) for img_link in img_links]
+        if len(imgs) == 0:
+            return None
+        return [link, post_text, imgs, othertags, user_id, date, likes]
+
+
+class InstagramPool:
+    def __init__(self, **kwargs):
+        r"""Multiple logged-in `Instagram` drivers that scrape posts in parallel.
+        Every driver consumes links from a shared queue, the results are merged
+        in the same order as the links, so it yields same results as `Instagram.get_data`.
+
+        `pool_size` in `insta_settings` decides the number of drivers.
+        """
+        self.pool_size = kwargs.get("pool_size", 1)
+        self.thres_links = kwargs["thres_links"]
+        self.downloader = ImageDownloader(
+            max_workers=kwargs.get("download_workers", 8),
+            max_per_host=kwargs.get("download_per_host", 4)
+        )
+        kwargs = dict(kwargs, downloader=self.downloader)
+        print(f"[INFO] Starting {self.pool_size} drivers...")
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            futures = [executor.submit(Instagram, **kwargs) for _ in range(self.pool_size)]
+        self.workers = [future.result() for future in futures if future.exception() is None]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            # a driver failed to start or login, the started ones would leak their browsers
+            print(f"[Error] {len(errors)} of {self.pool_size} drivers failed to start, closing the others")
+            self.close()
+            self.downloader.close()
+            raise errors[0]
+        self.free_workers = Queue()
+        for insta in self.workers:
+            self.free_workers.put(insta)
+
+    def collect_links(self, tag: str) -> list:
+        r"""can be called from several threads, every call takes a free driver"""
+        insta = self.free_workers.get()
+        try:
+            return insta.collect_links(tag)
+        finally:
+            self.free_workers.put(insta)
+
+    def get_data(self, links: list, on_skip: Union[Callable, None]=None) -> Generator:
+        link_queue = Queue()
+        for i, link in enumerate(links):
+            link_queue.put((i, link))
+        results = {}
+        condition = Condition()
+        stop = Event()
+
+        def work(insta: Instagram):
+            while not stop.is_set():
+                try:
+                    i, link = link_queue.get_nowait()
+                except Empty:
+                    return
+                try:
+                    data = insta.get_post(link)
+                except Exception as e:
+                    data = e
+                with condition:
+                    results[i] = data
+                    condition.notify_all()
+
+        threads = [Thread(target=work, args=(insta,), daemon=True) for insta in self.workers]
+        for t in threads:
+            t.start()
+        try:
+            for i in range(len(links)):
+                with condition:
+                    condition.wait_for(lambda: i in results)
+                    data = results.pop(i)
+                if isinstance(data, Exception):
+                    raise data
+                if data is None:
+                    if on_skip is not None:
+                        on_skip(links[i])
+                    continue
+                yield self.workers[0].finish_post(data)
+        finally:
+            stop.set()
+            for t in threads:
+                t.join()
+        for insta in self.workers:
+            insta.waiter.report()
+
+    def close(self):
+        for insta in self.workers:
+            insta.close()
 
-            else:
-                post_text = " "
-                othertags = " "
-            
-            # (... postlink TEXT, post TEXT, imgs TEXT, othertags TEXT, uid INTEGER, date TEXT, likes INTEGER)
-            temp = [
-                links[i], post_text, imgs, othertags, user_id, date, likes
-            ]
-            yield temp
\ No newline at end of file
@@ -0,0 +1,45 @@
+from pathlib import Path
+from typing import List
+from threading import Lock
+
+class Journal:
+    DONE = "done"
+    FAIL = "fail"
+
+    def __init__(self, path: Path):
+        r"""Progress journal of the crawling, every line is `status\tpostlink`.
+        The last status of the postlink wins.
+
+        Args:
+            path (Path): journal file path
+        """
+        self.path = Path(path)
+        self.status = {}
+        if self.path.exists():
+            with self.path.open("r", encoding="utf-8") as file:
+                for line in file:
+                    line = line.rstrip("\n")
+                    if "\t" in line:
+                        status, link = line.split("\t", 1)
+                        self.status[link] = status
+        self.file = self.path.open("a", encoding="utf-8")
+        self.lock = Lock()
+
+    def done(self, links: List[str]):
+        self._write(self.DONE, links)
+
+    def fail(self, link: str):
+        self._write(self.FAIL, [link])
+
+    def is_failed(self, link: str) -> bool:
+        return self.status.get(link) == self.FAIL
+
+    def close(self):
+        self.file.close()
+
+    def _write(self, status: str, links: List[str]):
+        with self.lock:
+            for link in links:
+                self.status[link] = status
+                print(f"{status}\t{link}", file=self.file)
+            self.file.flush()
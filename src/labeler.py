@@ -3,17 +3,19 @@
 # https://wikidocs.net/35490
 import io
 import re
+import time
+import bisect
 import pickle
-from PIL import Image
+from PIL import Image, ImageFile
 from pathlib import Path
-from .database import Database
+from .sharding import open_database
 from .utils import load_settings
 from PyQt5.QtCore import Qt, QEvent
 from PyQt5.QtGui import QIcon, QPixmap, QFont
 from PyQt5.QtWidgets import QDesktopWidget, QMainWindow, QWidget, QAction, \
     QLabel, QPushButton, QGridLayout, QHBoxLayout, QVBoxLayout, QTextBrowser, \
     QSlider, QComboBox, QMessageBox, QTextEdit, QShortcut, QProgressBar, QFrame, \
-    QFileDialog, QSpinBox, QListWidget, qApp
+    QFileDialog, QSpinBox, QListWidget, QLineEdit, qApp
 
 class Labeler(QMainWindow):
     TAG_CONTAINER_NAME = "{}_tag_container.pickle"
@@ -29,23 +31,24 @@ class Labeler(QMainWindow):
         self.conf_db = conf["db_settings"]
         self.conf_spider = conf["spider_settings"]
         
-        self.db = Database(**self.conf_db)
+        self.db = open_database(**self.conf_db)
         
         self.output_path = Path(self.conf_spider["output_path"])
         self.icon_path = Path("./icons")
 
-        self.img_split_tag = self.db.IMG_SPLIT_TAG
         self.hashtag_compiler = re.compile(self.HASHTAG_PATTERN)
 
         self.widgets = {}
         self.imgs = None
         self.img_height = 640
         self.img_width = 640
+        # decode + scale latency(seconds) of the shown images
+        self.image_latency = {"thumbnail": [], "original": []}
         self.w = QWidget()
         self.label_container = {}  # dictionary
+        self.search_ids = None  # sorted ids matched by the search query of current tag, None for all posts
         self.label_fmt = "{:06d}: {}"
         self.setCentralWidget(self.w)
-        self.c = self.db.get_cursor()
         self.initUI()
 
     def check_path(self, path: Path, typ: str="dir"):
@@ -145,9 +148,17 @@ class Labeler(QMainWindow):
             self._tags_clicked
         )
             
+        # full-text search of post text and hashtags, e.g. `cute cat`, `"cute cat"`, `#food`
+        self.widgets["search"] = QLineEdit()
+        self.widgets["search"].setPlaceholderText("Search posts(Enter), e.g. #food")
+        self.widgets["search"].returnPressed.connect(
+            self._search_entered
+        )
+
         vbox = QVBoxLayout()
         vbox.addWidget(QLabel("Avaiable tags:", self))
         vbox.addWidget(self.widgets["tags"])
+        vbox.addWidget(self.widgets["search"])
         hbox = QHBoxLayout()
         hbox.addWidget(label)
         hbox.addLayout(vbox)
@@ -306,17 +317,33 @@ class Labeler(QMainWindow):
         return vbox_progress
 
     def get_avaiable_tags(self):
-        sql = f"""SELECT DISTINCT tag FROM {self.db.table_name}"""
-        res = self.c.execute(sql).fetchall()
-        tags = list(map(lambda x: x[0], res))
+        tags = self.db.get_tags()
         return tags
 
     def get_avaiable_ids(self, tag):
-        sql = f"""SELECT id FROM {self.db.table_name} WHERE tag = '{tag}'"""
-        res = self.c.execute(sql).fetchall()
-        ids = list(map(lambda x: x[0], res))
+        if self.search_ids is not None:
+            return self.search_ids
+        # include the posts linked to the tag
+        ids = self.db.get_ids(tag)
         return ids
 
+    def get_id_range(self, tag):
+        if self.search_ids is not None:
+            return (self.search_ids[0], self.search_ids[-1]) if self.search_ids else (None, None)
+        return self.db.get_id_range(tag)
+
+    def get_next_id(self, tag, idx):
+        if self.search_ids is not None:
+            i = bisect.bisect_right(self.search_ids, idx)
+            return self.search_ids[i] if i < len(self.search_ids) else None
+        return self.db.get_next_id(tag, idx)
+
+    def get_prev_id(self, tag, idx):
+        if self.search_ids is not None:
+            i = bisect.bisect_left(self.search_ids, idx)
+            return self.search_ids[i-1] if i > 0 else None
+        return self.db.get_prev_id(tag, idx)
+
     def extract(self):
         current_tag = self._get_current_tag()
         if current_tag == self.TAG_BASE:
@@ -350,7 +377,9 @@ class Labeler(QMainWindow):
                 pbar.setValue(step)
 
     def exit(self):
-        self.c.close()
+        for source, latency in self.image_latency.items():
+            if latency:
+                print(f"[INFO] Image latency({source}): {sum(latency)/len(latency)*1000:.1f}ms avg of {len(latency)} images")
         self.db.close()
         self.save_label_container()
         qApp.quit()
@@ -408,17 +437,17 @@ class Labeler(QMainWindow):
         else:
             self.widgets["label_current"].setText("")
 
-        sql = f"""SELECT uid, postlink, post, imgs, othertags FROM {self.db.table_name}
-            WHERE id={db_id}
-            """
-        uid, link, post, imgs, othertags = self.c.execute(sql).fetchone()
+        uid, link, post, othertags = self.db.get_post(db_id)
         # set Post link
         self.widgets["link_current"].setText(link)
         # set Post link
         self.widgets["uid_current"].setText(str(uid))
 
         # set Image
-        self.imgs = self._set_post_img_label(imgs)
+        # empty image shows all videos message
+        # image hashes are read in chunks when shown, (legacy) bytes of not migrated posts
+        self.imgs = self._set_post_img_label(
+            self.db.get_post_images(db_id) or self.db.get_images(db_id) or [b""])
         self.widgets["post_img_label"].setPixmap(
             self._open_image(self.imgs[0])
         )
@@ -469,30 +498,50 @@ class Labeler(QMainWindow):
 
     def _tags_clicked(self, value: str):
         self.status_bar.showMessage(f"tag: {value} Selected")
+        self.search_ids = None
+        self.widgets["search"].setText("")
         if value == self.TAG_BASE:
             self.reset()
         else:
             self.load_label_container(value)
-            # get first id
-            sql = f"""SELECT MIN(id), MAX(id) FROM {self.db.table_name}
-                WHERE tag='{value}'
-                """
-            res = self.c.execute(sql).fetchone()
-            if res:
-                first_id = res[0]
-                max_id = res[1]
-                self.widgets["label_blank"].setMinimum(first_id)
-                self.widgets["label_blank"].setMaximum(max_id)                
-                self.load_data(first_id)
-                self.status_bar.showMessage("")
-            else:
-                self.status_bar.showMessage("Data is not exists.")
-            self._get_blank_id()
+            self._load_first()
 
+    def _search_entered(self):
+        current_tag = self._get_current_tag()
+        query = self.widgets["search"].text().strip()
+        if current_tag == self.TAG_BASE:
+            self.status_bar.showMessage("Cannot search at <SELECT> tag")
+            return
+        if query:
+            try:
+                self.search_ids = sorted(self.db.search(query, tag=current_tag))
+            except Exception as e:
+                self.status_bar.showMessage(f"Search failed: {e}")
+                return
+        else:
+            self.search_ids = None
+        self._show_progress()
+        self._load_first()
+        if query:
+            self.status_bar.showMessage(f"Search: {len(self.search_ids)} posts matched")
+
+    def _load_first(self):
+        current_tag = self._get_current_tag()
+        # get first id
+        first_id, max_id = self.get_id_range(current_tag)
+        if first_id is not None:
+            self.widgets["label_blank"].setMinimum(first_id)
+            self.widgets["label_blank"].setMaximum(max_id)                
+            self.load_data(first_id)
+            self.status_bar.showMessage("")
+        else:
+            self.status_bar.showMessage("Data is not exists.")
+            return
+        self._get_blank_id()
 
-    def _set_post_img_label(self, imgs: bytes):
+
+    def _set_post_img_label(self, imgs: list):
         r"""Please always return to `self.imgs`"""
-        imgs = imgs.split(self.img_split_tag)
         self.widgets["post_slider"].setMaximum(len(imgs)-1)
         self.widgets["post_slider_label"].setText(f"{1}")
         return imgs
@@ -501,6 +550,24 @@ class Labeler(QMainWindow):
         if image_byte == b"":
             qmap = QPixmap()
             self.status_bar.showMessage("Images are all videos")
+        elif isinstance(image_byte, str):
+            start = time.perf_counter()
+            thumbnail = self.db.get_thumbnail(image_byte)
+            if thumbnail is not None:
+                source = "thumbnail"
+                qmap = QPixmap()
+                qmap.loadFromData(thumbnail)
+            else:
+                # image hash without thumbnail: decode incrementally from the BLOB chunks
+                source = "original"
+                parser = ImageFile.Parser()
+                for chunk in self.db.iter_image_chunks(image_byte):
+                    parser.feed(chunk)
+                qmap = parser.close().toqpixmap()
+            qmap = qmap.scaled(self.img_width, self.img_height)
+            latency = time.perf_counter() - start
+            self.image_latency[source].append(latency)
+            self.status_bar.showMessage(f"Image({source}): {latency*1000:.1f}ms")
         else:
             qmap = Image.open(io.BytesIO(image_byte)).toqpixmap()
             qmap = qmap.scaled(self.img_width, self.img_height)
@@ -593,12 +660,9 @@ class Labeler(QMainWindow):
             pass
         else:
             current_id = self._get_current_post_id()
-            sql = f"""SELECT id FROM {self.db.table_name} 
-                WHERE id = {current_id+1} AND tag = '{current_tag}'
-                """
-            res = self.c.execute(sql).fetchone()
-            if res:
-                next_id = res[0]
+            # ids of a tag can have gaps when tags are crawled together
+            next_id = self.get_next_id(current_tag, current_id)
+            if next_id is not None:
                 self.load_data(next_id)
             else:
                 self.status_bar.showMessage("Next Image is not exists.")
@@ -610,13 +674,9 @@ class Labeler(QMainWindow):
             pass
         else:
             current_id = self._get_current_post_id()
-            sql = f"""SELECT id FROM {self.db.table_name} 
-                WHERE id = {current_id-1} AND tag = '{current_tag}'
-                """
-            res = self.c.execute(sql).fetchone()
-            if res:
-                next_id = res[0]
-                self.load_data(next_id)
+            prev_id = self.get_prev_id(current_tag, current_id)
+            if prev_id is not None:
+                self.load_data(prev_id)
             else:
                 self.status_bar.showMessage("Previous Image is not exists.")
             self._get_blank_id()
@@ -0,0 +1,53 @@
+import os
+from pathlib import Path
+from typing import Union
+
+class Manifest:
+    def __init__(self, path: Path):
+        r"""Extracted posts of an output directory, every line is `id\tdigest`(digest of `Database.get_posts_digest`).
+        Every run digests all posts of the tag(image BLOBs are not read), posts linked to the tag later
+        have smaller ids than the extracted ones, so the ids are compared instead of an id watermark.
+
+        Args:
+            path (Path): manifest file path
+        """
+        self.path = Path(path)
+        self.digests = {}
+        if self.path.exists():
+            with self.path.open("r", encoding="utf-8") as file:
+                for line in file:
+                    # `#last_id` header of old manifests
+                    if line.startswith("#"):
+                        continue
+                    key, value = line.rstrip("\n").split("\t", 1)
+                    self.digests[int(key)] = value
+
+    def plan(self, digests: dict, ids: Union[list, None]=None) -> tuple:
+        r"""compare the posts in database with the manifest
+
+        Args:
+            digests (dict): id: digest of the posts in database
+            ids (Union[list, None], optional): only these ids are extracted(e.g. search result), all when None. Defaults to None.
+
+        Returns:
+            tuple: (new ids, changed ids, deleted ids) in order, deleted ids are in manifest but not in database
+        """
+        ids = sorted(digests) if ids is None else ids
+        new = [i for i in ids if i not in self.digests]
+        changed = [i for i in ids if i in self.digests and self.digests[i] != digests[i]]
+        deleted = sorted(i for i in self.digests if i not in digests)
+        return new, changed, deleted
+
+    def update(self, digests: dict, written: list, deleted: list):
+        for i in written:
+            self.digests[i] = digests[i]
+        for i in deleted:
+            self.digests.pop(i, None)
+
+    def save(self):
+        r"""write into a temporary file and replace, the manifest is never left half written"""
+        tmp_path = self.path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as file:
+            for i in sorted(self.digests):
+                print(f"{i}\t{self.digests[i]}", file=file)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,96 @@
+import os
+import mmap
+from pathlib import Path
+from typing import Union, Iterable
+from .utils import import_numpy
+
+# a record of the index per image
+INDEX_FIELDS = [("offset", "<u8"), ("length", "<u4"), ("post_id", "<i8"), ("idx", "<u2")]
+
+def packed_paths(path: Union[str, Path]) -> tuple:
+    r"""(`{path}.bin`, `{path}.idx.npy`) of a packed dataset"""
+    path = Path(path)
+    return path.with_name(path.name + ".bin"), path.with_name(path.name + ".idx.npy")
+
+def pack_images(db, path: Union[str, Path], post_ids: Iterable[int]) -> int:
+    r"""append the images of the posts to the packed dataset of `path`(see `PackedDataset`), the posts already in the index
+    are skipped, so packing again(or another tag) only appends the posts not packed yet. Images are copied from database in chunks,
+    the index is replaced atomically after the image bytes are flushed. Returns the number of images appended.
+
+    Args:
+        db (Union[Database, ShardedDatabase]): source database
+        path (Union[str, Path]): dataset path without suffix
+        post_ids (Iterable[int]): ids of the posts
+    """
+    np = import_numpy("Packed dataset")
+    bin_path, index_path = packed_paths(path)
+    index = np.load(index_path) if index_path.exists() else np.zeros(0, dtype=INDEX_FIELDS)
+    post_ids = np.fromiter(post_ids, dtype=np.int64)
+    post_ids = np.unique(post_ids[~np.isin(post_ids, index["post_id"])])
+    # bytes after the last indexed image are left by an interrupted pack
+    end = int(index["offset"][-1]) + int(index["length"][-1]) if len(index) else 0
+
+    records = []
+    with bin_path.open("ab") as writer:
+        writer.truncate(end)
+        writer.seek(end)
+        for post_id in post_ids.tolist():
+            for i, (_, copy) in enumerate(db.iter_post_images(post_id)):
+                offset = writer.tell()
+                records.append((offset, copy(writer), post_id, i))
+        writer.flush()
+        os.fsync(writer.fileno())
+    if records:
+        index = np.concatenate([index, np.array(records, dtype=INDEX_FIELDS)])
+        # np.save appends `.npy` to names without it
+        tmp_path = index_path.with_name(index_path.name[:-len(".idx.npy")] + ".tmp.npy")
+        np.save(tmp_path, index)
+        os.replace(tmp_path, index_path)
+    return len(records)
+
+class PackedDataset:
+    def __init__(self, path: Union[str, Path]):
+        r"""images packed into `{path}.bin` by `pack_images`, indexed by `{path}.idx.npy`(`INDEX_FIELDS` records).
+        The file is memory-mapped, `dataset[k]` is a zero-copy `memoryview` of the k-th image,
+        decode it with e.g. `PIL.Image.open(io.BytesIO(dataset[k]))`.
+
+        Args:
+            path (Union[str, Path]): dataset path without suffix
+        """
+        np = import_numpy("Packed dataset")
+        bin_path, index_path = packed_paths(path)
+        self.index = np.load(index_path, mmap_mode="r")
+        self.offsets = self.index["offset"]
+        self.lengths = self.index["length"]
+        self.post_ids = self.index["post_id"]
+        # appended posts are not in id order, images of a post are kept in order by the stable sort
+        self._order = np.argsort(self.post_ids, kind="stable")
+        self._sorted_ids = self.post_ids[self._order]
+        self.file = bin_path.open("rb")
+        size = os.fstat(self.file.fileno()).st_size
+        # an empty file can not be mapped
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.view = memoryview(self.mmap) if size else memoryview(b"")
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, k: int) -> memoryview:
+        offset = int(self.offsets[k])
+        return self.view[offset:offset + int(self.lengths[k])]
+
+    def get_post(self, post_id: int) -> list:
+        r"""images of a post in order"""
+        np = import_numpy("Packed dataset")
+        start, end = np.searchsorted(self._sorted_ids, [post_id, post_id + 1])
+        return [self[int(k)] for k in self._order[start:end]]
+
+    def close(self):
+        # slices handed out keep the buffer exported, the map is closed when they are released
+        self.view.release()
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError:
+                pass
+        self.file.close()
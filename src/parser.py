@@ -0,0 +1,61 @@
+import bs4
+from typing import Iterable
+from bs4 import BeautifulSoup, SoupStrainer
+
+class PostParser:
+    BACKENDS = ["html.parser", "lxml", "selectolax"]
+
+    def __init__(self, backend: str="html.parser", classes: Iterable[str]=None):
+        r"""Parse only the subtrees of the page that we need.
+
+        Args:
+            backend (str, optional): one of "html.parser", "lxml", "selectolax". Defaults to "html.parser".
+                "html.parser" and "lxml" parse with a `SoupStrainer` restricted to `classes`,
+                "selectolax" selects the subtrees by css selectors first and parse them with `bs4`.
+            classes (Iterable[str], optional): class attributes to keep, such as `Instagram.ATTRS_*`.
+                Parse the whole page when None. Defaults to None.
+        """
+        if backend not in self.BACKENDS:
+            raise Exception(f"[Error] Not supported parser `{backend}`, should be one of {self.BACKENDS}")
+        self.backend = backend
+        self.classes = set()
+        for c in (classes or []):
+            self.classes.update(c.split())
+        self.strainer = SoupStrainer(attrs={"class": self._match_class}) if self.classes else None
+        if backend == "selectolax":
+            from selectolax.lexbor import LexborHTMLParser
+            self._html_parser = LexborHTMLParser
+            self._selector = ",".join(f".{c}" for c in sorted(self.classes))
+            self._fragment_backend = "lxml" if self._has_lxml() else "html.parser"
+
+    def parse(self, html: str) -> bs4.BeautifulSoup:
+        if self.backend == "selectolax":
+            if self.classes:
+                html = self._select_fragments(html)
+            return BeautifulSoup(html, self._fragment_backend)
+        return BeautifulSoup(html, self.backend, parse_only=self.strainer)
+
+    def _match_class(self, value: str) -> bool:
+        return value is not None and not self.classes.isdisjoint(value.split())
+
+    def _select_fragments(self, html: str) -> str:
+        tree = self._html_parser(html)
+        nodes = tree.css(self._selector)
+        selected = set(node.mem_id for node in nodes)
+        fragments = []
+        for node in nodes:
+            # skip the node if it is already inside of selected node
+            parent = node.parent
+            while parent is not None and parent.mem_id not in selected:
+                parent = parent.parent
+            if parent is None:
+                fragments.append(node.html)
+        return "".join(fragments)
+
+    @staticmethod
+    def _has_lxml() -> bool:
+        try:
+            import lxml
+            return True
+        except ImportError:
+            return False
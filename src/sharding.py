@@ -0,0 +1,342 @@
+import heapq
+import sqlite3
+import hashlib
+from pathlib import Path
+from typing import List, Tuple, Callable, Union, Iterator, BinaryIO
+from .database import Database
+
+def open_database(**kwargs) -> Union[Database, "ShardedDatabase"]:
+    r"""`ShardedDatabase` when `shards` of `db_settings` is set, otherwise `Database`"""
+    if kwargs.get("shards"):
+        return ShardedDatabase(**kwargs)
+    return Database(**kwargs)
+
+class ShardedDatabase:
+    def __init__(self, **kwargs):
+        r"""Posts are routed by tag to `shards` SQLite files, every shard is a `Database`.
+        A catalog file assigns the ids and records the shard of every tag and post.
+        Tag queries fan out to all shards, id queries go to the shard of the post.
+        Adding shards only routes the new tags to them, run `rebalance` to move the old tags.
+
+        Files in `./database`: `{stem}_catalog{suffix}` and `{stem}_shard{i}{suffix}` of `db_name`
+
+        Args:
+            same as `Database`, and
+            shards (int): number of shards that new tags are routed to
+        """
+        self.kwargs = kwargs
+        self.n_shards = kwargs["shards"]
+        self.table_name = kwargs["table_name"]
+        db_name = Path(kwargs["db_name"])
+        self.stem, self.suffix = db_name.stem, db_name.suffix
+        self.catalog_name = f"./database/{self.stem}_catalog{self.suffix}"
+        self.posts_table_name = f"{self.table_name}_posts"
+        self.tag_shards_table_name = f"{self.table_name}_tag_shards"
+        self.shards_table_name = f"{self.table_name}_shards"
+        self.read_only = kwargs.get("read_only", False)
+        self.start()
+        if not self.read_only:
+            self.create_table()
+        self.shards = [self._open_shard(i) for i in range(max(self.n_shards, self._registered_shards()))]
+
+    def start(self):
+        timeout = self.kwargs.get("busy_timeout", 5000) / 1000
+        if self.read_only:
+            self.conn = sqlite3.connect(f"file:{self.catalog_name}?mode=ro", uri=True, timeout=timeout)
+            return
+        self.conn = sqlite3.connect(self.catalog_name, timeout=timeout)
+        if self.kwargs.get("journal_mode") is not None:
+            self.conn.execute(f"PRAGMA journal_mode = {self.kwargs['journal_mode']}")
+
+    def create_table(self):
+        r"""
+        {table_name}_posts: id assignment and shard of the posts
+            id INTEGER: id of the post, unique among shards
+            tag TEXT: searched tag
+            postlink TEXT: post link
+            shard INTEGER: shard that stores the post
+        {table_name}_tag_shards: shard of the tags
+        {table_name}_shards: registered shard files
+        """
+        c = self._begin_immediate()
+        c.execute(f"""CREATE TABLE IF NOT EXISTS {self.posts_table_name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, tag TEXT, postlink TEXT, shard INTEGER,
+            UNIQUE (tag, postlink))""")
+        c.execute(f"""CREATE INDEX IF NOT EXISTS {self.posts_table_name}_postlink
+            ON {self.posts_table_name} (postlink, shard)""")
+        c.execute(f"""CREATE TABLE IF NOT EXISTS {self.tag_shards_table_name} (
+            tag TEXT PRIMARY KEY, shard INTEGER)""")
+        c.execute(f"""CREATE TABLE IF NOT EXISTS {self.shards_table_name} (
+            shard INTEGER PRIMARY KEY, db_name TEXT)""")
+        c.close()
+        self.conn.commit()
+
+    def _registered_shards(self) -> int:
+        res = self.conn.execute(f"""SELECT MAX(shard) FROM {self.shards_table_name}""").fetchone()[0]
+        return 0 if res is None else res + 1
+
+    def _open_shard(self, shard: int) -> Database:
+        db_name = f"{self.stem}_shard{shard}{self.suffix}"
+        if not self.read_only:
+            self.conn.execute(f"""INSERT OR IGNORE INTO {self.shards_table_name} VALUES (?,?)""", (shard, db_name))
+            self.conn.commit()
+        return Database(**{**self.kwargs, "db_name": db_name})
+
+    def _begin_immediate(self) -> sqlite3.Cursor:
+        if self.conn.in_transaction:
+            self.conn.commit()
+        c = self.conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        return c
+
+    # routing
+    def route(self, tag: str) -> int:
+        r"""shard of a new tag by stable hash, the recorded shard of a tag may differ before `rebalance`"""
+        return int(hashlib.sha1(tag.encode("utf-8")).hexdigest(), 16) % self.n_shards
+
+    def get_tag_shard(self, tag: str) -> Union[int, None]:
+        res = self.conn.execute(f"""SELECT shard FROM {self.tag_shards_table_name} WHERE tag = ?""", (tag,)).fetchone()
+        return None if res is None else res[0]
+
+    def get_shard(self, post_id: int) -> Database:
+        res = self.conn.execute(f"""SELECT shard FROM {self.posts_table_name} WHERE id = ?""", (post_id,)).fetchone()
+        if res is None:
+            raise Exception(f"[Error] Post not exists: {post_id}")
+        return self.shards[res[0]]
+
+    def assign_ids(self, batch: List[Tuple]) -> List[Tuple]:
+        r"""(id, shard) of the rows in catalog, already assigned (tag, postlink) gets the same id"""
+        c = self._begin_immediate()
+        assigned = []
+        for row in batch:
+            tag, postlink = row[1], row[2]
+            shard = self.get_tag_shard(tag)
+            if shard is None:
+                shard = self.route(tag)
+                c.execute(f"""INSERT INTO {self.tag_shards_table_name} VALUES (?,?)""", (tag, shard))
+            c.execute(f"""INSERT OR IGNORE INTO {self.posts_table_name} (tag, postlink, shard) VALUES (?,?,?)""",
+                (tag, postlink, shard))
+            res = c.execute(f"""SELECT id, shard FROM {self.posts_table_name} WHERE tag = ? AND postlink = ?""",
+                (tag, postlink)).fetchone()
+            assigned.append(res)
+        c.close()
+        self.conn.commit()
+        return assigned
+
+    def _group_by_shard(self, batch: List[Tuple]) -> dict:
+        r"""shard: (positions, rows with assigned ids)"""
+        groups = {}
+        for i, (row, (post_id, shard)) in enumerate(zip(batch, self.assign_ids(batch))):
+            positions, rows = groups.setdefault(shard, ([], []))
+            positions.append(i)
+            rows.append([post_id] + list(row[1:]))
+        return groups
+
+    # writes
+    def insert(self, batch: List[Tuple]) -> list:
+        r"""same as `Database.insert`, ids are assigned by catalog"""
+        ids = [None] * len(batch)
+        for shard, (positions, rows) in self._group_by_shard(batch).items():
+            for i, post_id in zip(positions, self.shards[shard].insert(rows)):
+                ids[i] = post_id
+        return ids
+
+    def ingest(self, batch: List[Tuple], retries: Union[int, None]=None) -> list:
+        r"""same as `Database.ingest`, rows are committed to their shards"""
+        ids = [None] * len(batch)
+        for shard, (positions, rows) in self._group_by_shard(batch).items():
+            for i, post_id in zip(positions, self.shards[shard].ingest(rows, retries)):
+                ids[i] = post_id
+        return ids
+
+    def link_tags(self, pairs: List[Tuple]):
+        r"""link the stored posts to other tags, the link is stored in the shard of the post"""
+        groups = {}
+        sql = f"""SELECT shard FROM {self.posts_table_name} WHERE postlink = ? LIMIT 1"""
+        for tag, postlink in pairs:
+            res = self.conn.execute(sql, (postlink,)).fetchone()
+            if res is not None:
+                groups.setdefault(res[0], []).append((tag, postlink))
+        for shard, shard_pairs in groups.items():
+            self.shards[shard].link_tags(shard_pairs)
+
+    def delete_post(self, post_id: int):
+        self.get_shard(post_id).delete_post(post_id)
+        self.conn.execute(f"""DELETE FROM {self.posts_table_name} WHERE id = ?""", (post_id,))
+
+    def commit(self):
+        for db in self.shards:
+            db.commit()
+        self.conn.commit()
+
+    def close(self):
+        for db in self.shards:
+            db.close()
+        self.conn.close()
+
+    def recreate(self):
+        for db in self.shards:
+            db.recreate()
+        c = self.conn.cursor()
+        c.execute(f"DROP TABLE IF EXISTS {self.posts_table_name}")
+        c.execute(f"DROP TABLE IF EXISTS {self.tag_shards_table_name}")
+        c.close()
+        self.create_table()
+
+    def rebalance(self) -> list:
+        r"""move the tags to the shard of `route`, e.g. after `shards` is increased.
+        Run `vacuum` after it to give the space of old shards back to disk.
+
+        Returns:
+            list: moved tags
+        """
+        moved = []
+        tag_shards = self.conn.execute(f"""SELECT tag, shard FROM {self.tag_shards_table_name}""").fetchall()
+        for tag, shard in tag_shards:
+            if shard != self.route(tag):
+                self.move_tag(tag, self.route(tag))
+                moved.append(tag)
+        return moved
+
+    def move_tag(self, tag: str, shard: int):
+        r"""move the posts of the tag into another shard, ids are kept.
+        The target shard is committed first, so an interrupted move leaves duplicated posts but never loses one.
+        """
+        src, dst = self.shards[self.get_tag_shard(tag)], self.shards[shard]
+        columns = "id, tag, postlink, post, othertags, uid, date, likes"
+        rows = src.get_cursor().execute(f"""SELECT {columns} FROM {src.table_name} WHERE tag = ?""", (tag,)).fetchall()
+        # kept originals and thumbnails go along with the images
+        batch, thumbnails = [], {}
+        for row in rows:
+            imgs, post_thumbnails = src.get_post_media(row[0])
+            batch.append(list(row[:4]) + [imgs] + list(row[4:]))
+            thumbnails.update(post_thumbnails)
+        dst.ingest(batch, thumbnails=thumbnails)
+        c = self._begin_immediate()
+        c.execute(f"""UPDATE {self.tag_shards_table_name} SET shard = ? WHERE tag = ?""", (shard, tag))
+        c.execute(f"""UPDATE {self.posts_table_name} SET shard = ? WHERE tag = ?""", (shard, tag))
+        c.close()
+        self.conn.commit()
+        for row in rows:
+            src.delete_post(row[0])
+        # links follow the posts when no post of the postlink remains
+        postlinks = [row[2] for row in rows]
+        remains = src.get_postlinks()
+        sql = f"""SELECT tag, postlink FROM {src.tags_table_name} WHERE postlink = ?"""
+        links = [pair for l in postlinks if l not in remains for pair in src.get_cursor().execute(sql, (l,)).fetchall()]
+        dst.link_tags(links)
+        dst.commit()
+        src.get_cursor().executemany(f"""DELETE FROM {src.tags_table_name} WHERE tag = ? AND postlink = ?""", links)
+        src.commit()
+        print(f"[INFO] Shard: {tag} moved to shard {shard}, {len(rows)} posts")
+
+    # fan-out queries
+    def get_postlinks(self, tag: Union[str, None]=None) -> set:
+        return set().union(*[db.get_postlinks(tag) for db in self.shards])
+
+    def get_tags(self) -> list:
+        return sorted(set().union(*[db.get_tags() for db in self.shards]))
+
+    def get_ids(self, tag: str) -> list:
+        return list(heapq.merge(*[db.get_ids(tag) for db in self.shards]))
+
+    def count_posts(self, tag: Union[str, None]=None) -> int:
+        return sum(db.count_posts(tag) for db in self.shards)
+
+    def get_id_range(self, tag: str) -> tuple:
+        ranges = [r for r in (db.get_id_range(tag) for db in self.shards) if r[0] is not None]
+        if not ranges:
+            return (None, None)
+        return (min(r[0] for r in ranges), max(r[1] for r in ranges))
+
+    def get_next_id(self, tag: str, idx: int) -> Union[int, None]:
+        ids = [x for x in (db.get_next_id(tag, idx) for db in self.shards) if x is not None]
+        return min(ids) if ids else None
+
+    def get_prev_id(self, tag: str, idx: int) -> Union[int, None]:
+        ids = [x for x in (db.get_prev_id(tag, idx) for db in self.shards) if x is not None]
+        return max(ids) if ids else None
+
+    def get_posts(self, tag: str, id_range: Union[Tuple[int, int], None]=None) -> Iterator[tuple]:
+        r"""(id, postlink, uid, post, othertags, date, likes) of all shards in id order"""
+        return heapq.merge(*[db.get_posts(tag, id_range) for db in self.shards], key=lambda x: x[0])
+
+    def get_posts_digest(self, tag: str) -> Iterator[tuple]:
+        return heapq.merge(*[db.get_posts_digest(tag) for db in self.shards], key=lambda x: x[0])
+
+    def get_posts_meta(self, tag: str) -> Iterator[tuple]:
+        return heapq.merge(*[db.get_posts_meta(tag) for db in self.shards], key=lambda x: x[0])
+
+    def search_posts(self, query: str, tag: Union[str, None]=None, order: str="bm25",
+            limit: Union[int, None]=None) -> List[tuple]:
+        r"""same as `Database.search_posts`, bm25 ranks are computed per shard"""
+        key = (lambda x: x[1]) if order == "bm25" else (lambda x: -(x[2] or 0))
+        res = heapq.merge(*[db.search_posts(query, tag, order, limit) for db in self.shards], key=key)
+        return list(res)[:limit]
+
+    def search(self, query: str, tag: Union[str, None]=None, order: str="bm25", limit: Union[int, None]=None) -> list:
+        return [x[0] for x in self.search_posts(query, tag, order, limit)]
+
+    def get_last_id(self):
+        return self.conn.execute(f"""SELECT MAX(id) FROM {self.posts_table_name} HAVING MAX(id) IS NOT NULL""").fetchall()
+
+    # post queries
+    def get_post(self, post_id: int) -> Union[tuple, None]:
+        return self.get_shard(post_id).get_post(post_id)
+
+    def get_post_images(self, post_id: int) -> list:
+        return self.get_shard(post_id).get_post_images(post_id)
+
+    def get_images(self, post_id: int) -> List[bytes]:
+        return self.get_shard(post_id).get_images(post_id)
+
+    def iter_post_images(self, post_id: int) -> Iterator[Tuple[int, Callable[[BinaryIO], int]]]:
+        return self.get_shard(post_id).iter_post_images(post_id)
+
+    # image queries, the hash is looked up in the shards
+    def get_image_shard(self, h: str) -> Database:
+        for db in self.shards:
+            if db.has_image(h):
+                return db
+        raise Exception(f"[Error] Image not exists: {h}")
+
+    def get_image(self, h: str) -> bytes:
+        return self.get_image_shard(h).get_image(h)
+
+    def get_original(self, h: str) -> Union[bytes, None]:
+        return self.get_image_shard(h).get_original(h)
+
+    def get_thumbnail(self, h: str) -> Union[bytes, None]:
+        return self.get_image_shard(h).get_thumbnail(h)
+
+    def get_image_size(self, h: str) -> int:
+        return self.get_image_shard(h).get_image_size(h)
+
+    def iter_image_chunks(self, h: str, chunk_size: int=2**16) -> Iterator[bytes]:
+        return self.get_image_shard(h).iter_image_chunks(h, chunk_size)
+
+    def copy_image(self, h: str, writer: BinaryIO, chunk_size: int=2**16) -> int:
+        return self.get_image_shard(h).copy_image(h, writer, chunk_size)
+
+    # maintenance
+    def get_schema_version(self) -> int:
+        return min(db.get_schema_version() for db in self.shards)
+
+    def check_query_plans(self) -> dict:
+        return self.shards[0].check_query_plans()
+
+    def migrate_images(self, batch_size: int=100) -> dict:
+        for db in self.shards:
+            db.migrate_images(batch_size)
+        return self.image_stats()
+
+    def backfill_thumbnails(self, size: Union[int, None]=None, batch_size: int=100, workers: Union[int, None]=None) -> int:
+        return sum(db.backfill_thumbnails(size, batch_size, workers) for db in self.shards)
+
+    def image_stats(self) -> dict:
+        stats = [db.image_stats() for db in self.shards]
+        return {k: sum(s[k] for s in stats) for k in stats[0]}
+
+    def vacuum(self):
+        for db in self.shards:
+            db.vacuum()
@@ -0,0 +1,160 @@
+import io
+import os
+import json
+import time
+from pathlib import Path
+from typing import Union, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .sharding import open_database
+from .imaging import decode_resized
+from .utils import import_numpy
+
+# a record of the index per image, `label` is the position in `labels` of meta.json, -1 for unlabeled.
+# `uid` is the position in `users` of meta.json, uid is the user name(`Instagram.parse_post_info`)
+INDEX_FIELDS = [("post_id", "<i8"), ("idx", "<u2"), ("uid", "<i4"), ("likes", "<i8"), ("label", "<i2"), ("valid", "?")]
+IMAGES_NAME = "images.u8"
+INDEX_NAME = "index.npy"
+META_NAME = "meta.json"
+
+# state of a decode worker process
+_decode_worker = {}
+
+def _init_decode_worker(conf_db: dict, images_path: str, size: Tuple[int, int]):
+    _decode_worker["db"] = open_database(**{**conf_db, "read_only": True})
+    _decode_worker["images_path"] = images_path
+    _decode_worker["size"] = size
+
+def _decode_chunk(start: int, post_ids: list, n_rows: int) -> Tuple[int, list]:
+    r"""decode the images of the posts into rows `start` ~ `start + n_rows` of the memmap. Returns (start, valid flags)"""
+    np = import_numpy("Tensor cache")
+    db = _decode_worker["db"]
+    width, height = _decode_worker["size"]
+    images = np.memmap(_decode_worker["images_path"], dtype=np.uint8, mode="r+",
+        offset=start * height * width * 3, shape=(n_rows, height, width, 3))
+    valid = []
+    for post_id in post_ids:
+        for _, copy in db.iter_post_images(post_id):
+            # posts changed after the rows were counted
+            if len(valid) >= n_rows:
+                break
+            buffer = io.BytesIO()
+            copy(buffer)
+            im = decode_resized(buffer.getvalue(), (width, height))
+            if im is not None:
+                images[len(valid)] = np.asarray(im)
+            valid.append(im is not None)
+    images.flush()
+    del images
+    return start, valid
+
+def build_tensor_cache(conf_db: dict, path: Union[str, Path], tag: str, labels: Union[dict, None]=None,
+        size: Tuple[int, int]=(224, 224), workers: int=4, chunk: int=64) -> dict:
+    r"""decode and resize every image of the tag once into `{path}/images.u8`, a uint8 memmap of (N, height, width, 3),
+    aligned with `{path}/index.npy`(`INDEX_FIELDS` records) and `{path}/meta.json`(size, label and user names).
+    Posts are split into chunks of `chunk` posts decoded by worker processes, each writes its rows of the memmap
+    with an own read-only connection. Building again only decodes the posts not cached yet,
+    the labels of all rows are joined again. Undecodable images are left black with `valid` False.
+
+    Args:
+        conf_db (dict): `db_settings`
+        path (Union[str, Path]): cache directory
+        tag (str): tag of the posts, include the linked posts
+        labels (Union[dict, None], optional): post id: label(label container of `Labeler`). Defaults to None.
+        size (Tuple[int, int], optional): (width, height) of the images, must match an existing cache. Defaults to (224, 224).
+        workers (int, optional): decode processes. Defaults to 4.
+        chunk (int, optional): posts per task. Defaults to 64.
+
+    Returns:
+        dict: {"images": rows of the cache, "new": rows decoded, "failed": undecodable rows, "seconds": decode time}
+    """
+    np = import_numpy("Tensor cache")
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    width, height = size
+    row_bytes = height * width * 3
+    images_path, index_path, meta_path = path / IMAGES_NAME, path / INDEX_NAME, path / META_NAME
+    meta = json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists() else {"labels": [], "users": []}
+    if meta.get("size", list(size)) != list(size):
+        raise Exception(f"[Error] Tensor cache {path} has size {meta['size']}, rebuild it into another path for {size}")
+    index = np.load(index_path) if index_path.exists() else np.zeros(0, dtype=INDEX_FIELDS)
+    cached = set(index["post_id"].tolist())
+    users = meta["users"]
+    user_codes = {name: i for i, name in enumerate(users)}
+
+    # rows of the new posts, image counts come from the metadata without reading the BLOBs
+    db = open_database(**{**conf_db, "read_only": True})
+    records, tasks = [], []
+    start, task_ids, task_rows = len(index), [], 0
+    for post_id, _, _, _, uid, _, likes, n_imgs, _ in db.get_posts_meta(tag):
+        if post_id in cached:
+            continue
+        n_imgs = n_imgs or sum(1 for _ in db.iter_post_images(post_id))
+        # numbers of old rows are kept as text
+        uid = str(uid)
+        if uid not in user_codes:
+            user_codes[uid] = len(users)
+            users.append(uid)
+        records.extend((post_id, i, user_codes[uid], likes, -1, False) for i in range(n_imgs))
+        task_ids.append(post_id)
+        task_rows += n_imgs
+        if len(task_ids) >= chunk:
+            tasks.append((start, task_ids, task_rows))
+            start, task_ids, task_rows = start + task_rows, [], 0
+    if task_ids:
+        tasks.append((start, task_ids, task_rows))
+    db.close()
+    new = np.array(records, dtype=INDEX_FIELDS)
+
+    # rows after the index are left by an interrupted build
+    with open(images_path, "ab") as file:
+        file.truncate((len(index) + len(new)) * row_bytes)
+    elapsed = 0.0
+    if tasks:
+        begin = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_decode_worker,
+                initargs=(conf_db, str(images_path), size)) as executor:
+            futures = [executor.submit(_decode_chunk, *task) for task in tasks]
+            for future in as_completed(futures):
+                start, valid = future.result()
+                new["valid"][start - len(index):start - len(index) + len(valid)] = valid
+        elapsed = time.perf_counter() - begin
+    index = np.concatenate([index, new])
+
+    # labels are joined for all rows, posts are labeled after they are cached
+    labels = labels or {}
+    names = meta["labels"] + sorted(set(labels.values()) - set(meta["labels"]))
+    codes = {name: i for i, name in enumerate(names)}
+    index["label"] = [codes.get(labels.get(post_id), -1) for post_id in index["post_id"].tolist()]
+
+    tmp_path = path / "index.tmp.npy"
+    np.save(tmp_path, index)
+    os.replace(tmp_path, index_path)
+    meta_path.write_text(json.dumps({"size": list(size), "labels": names, "users": users}, ensure_ascii=False), encoding="utf-8")
+    return {"images": len(index), "new": len(new), "failed": int((~new["valid"]).sum()), "seconds": elapsed}
+
+class TensorCache:
+    def __init__(self, path: Union[str, Path]):
+        r"""read a cache of `build_tensor_cache`, `images` is a read-only uint8 memmap of (N, height, width, 3),
+        `index` holds the aligned `post_id, idx, uid, likes, label, valid` arrays, `labels` the label names
+        and `users` the user names of `uid`.
+
+        Args:
+            path (Union[str, Path]): cache directory
+        """
+        np = import_numpy("Tensor cache")
+        path = Path(path)
+        meta = json.loads((path / META_NAME).read_text(encoding="utf-8"))
+        width, height = meta["size"]
+        self.labels = meta["labels"]
+        self.users = meta["users"]
+        self.index = np.load(path / INDEX_NAME, mmap_mode="r")
+        self.images = np.memmap(path / IMAGES_NAME, dtype=np.uint8, mode="r", shape=(len(self.index), height, width, 3)) \
+            if len(self.index) else np.zeros((0, height, width, 3), dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, k: int) -> tuple:
+        r"""(image array of (height, width, 3), label name or None)"""
+        label = int(self.index["label"][k])
+        return self.images[k], self.labels[label] if label >= 0 else None
@@ -3,4 +3,12 @@ import yaml
 def load_settings(settings_path):
     with open(settings_path) as f:
         conf = yaml.load(f, Loader=yaml.FullLoader)
-    return conf
\ No newline at end of file
+    return conf
+
+def import_numpy(feature: str):
+    r"""numpy is optional, it is imported when `feature` is used"""
+    try:
+        import numpy as np
+    except ImportError:
+        raise Exception(f"[Error] {feature} requires `numpy`, run `pip install numpy`")
+    return np
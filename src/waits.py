@@ -0,0 +1,128 @@
+import time
+from typing import Callable, Union
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+# install a MutationObserver once per page, return true when the document is loaded and
+# there is no DOM mutation and no new network resource for `arguments[0]` milliseconds
+PAGE_IDLE_SCRIPT = """
+var now = performance.now();
+if (!window.__spiderObserver) {
+    window.__spiderLastChange = now;
+    window.__spiderObserver = new MutationObserver(function() {
+        window.__spiderLastChange = performance.now();
+    });
+    window.__spiderObserver.observe(document, {childList: true, subtree: true});
+}
+var n = performance.getEntriesByType("resource").length;
+if (n !== window.__spiderResources) {
+    window.__spiderResources = n;
+    window.__spiderLastChange = now;
+}
+return document.readyState === "complete" && now - window.__spiderLastChange >= arguments[0];
+"""
+
+class AdaptiveDelay:
+    def __init__(self, initial: float, minimum: float=0.2, maximum: float=None, alpha: float=0.3, factor: float=2.0):
+        r"""Fallback delay that follows the recent page loading time.
+        It is an exponential moving average of observed waits multiplied by `factor`,
+        clipped into [`minimum`, `maximum`]. Shrinks when pages load fast.
+
+        Args:
+            initial (float): initial delay in seconds
+            minimum (float, optional): minimum delay. Defaults to 0.2.
+            maximum (float, optional): maximum delay, `initial` when None. Defaults to None.
+            alpha (float, optional): smoothing factor of moving average. Defaults to 0.3.
+            factor (float, optional): safety margin over the average. Defaults to 2.0.
+        """
+        self.minimum = minimum
+        self.maximum = initial if maximum is None else maximum
+        self.alpha = alpha
+        self.factor = factor
+        self.average = initial / factor
+
+    @property
+    def delay(self) -> float:
+        return min(max(self.average * self.factor, self.minimum), self.maximum)
+
+    def update(self, elapsed: float):
+        self.average = self.alpha * elapsed + (1 - self.alpha) * self.average
+
+class PageWaiter:
+    def __init__(self, driver, sleep_time: float, mode: str="event", timeout: float=None, quiet_ms: int=300):
+        r"""Wait layer of the navigation, replaces fixed `sleep(sleep_time)`
+
+        Args:
+            driver: selenium webdriver
+            sleep_time (float): the fixed sleep time that used to be, also a baseline to report saved time
+            mode (str, optional): "event" waits for DOM and network idle, "sleep" sleeps `sleep_time`. Defaults to "event".
+            timeout (float, optional): maximum time of event wait, `sleep_time` when None. Defaults to None.
+            quiet_ms (int, optional): no DOM mutation and network period(ms) regarded as idle. Defaults to 300.
+        """
+        self.driver = driver
+        self.sleep_time = sleep_time
+        self.mode = mode
+        self.timeout = sleep_time if timeout is None else timeout
+        self.quiet_ms = quiet_ms
+        self.fallback = AdaptiveDelay(sleep_time)
+        # wall-clock stats
+        self.waited = 0.0
+        self.baseline = 0.0
+        self.post_saved = []
+        self._post_start = (0.0, 0.0)
+
+    def wait(self, condition: Union[Callable, None]=None, baseline: Union[float, None]=None,
+            timeout: Union[float, None]=None) -> bool:
+        """wait until the page is idle and `condition(driver)` is true
+
+        Args:
+            condition (Union[Callable, None], optional): extra condition. Defaults to None.
+            baseline (Union[float, None], optional): fixed sleep time that used to be, `sleep_time` when None. Defaults to None.
+            timeout (Union[float, None], optional): maximum time of event wait. Defaults to None.
+
+        Returns:
+            bool: False if the condition is not satisfied
+        """
+        baseline = self.sleep_time if baseline is None else baseline
+        start = time.perf_counter()
+        satisfied = True
+        if self.mode == "sleep":
+            time.sleep(baseline)
+        else:
+            timeout = self.timeout if timeout is None else timeout
+            idle = lambda d: d.execute_script(PAGE_IDLE_SCRIPT, self.quiet_ms) and (condition is None or condition(d))
+            try:
+                WebDriverWait(self.driver, timeout, poll_frequency=0.05).until(idle)
+                self.fallback.update(time.perf_counter() - start)
+            except (TimeoutException, WebDriverException):
+                # page is still changing or script failed, give it a short extra time,
+                # the whole wait never exceeds the fixed sleep(or the timeout when it is longer)
+                elapsed = time.perf_counter() - start
+                self.fallback.update(elapsed)
+                extra = min(self.fallback.delay, max(baseline, timeout) - elapsed)
+                if extra > 0:
+                    time.sleep(extra)
+                satisfied = condition is None or self._check(condition)
+        self.waited += time.perf_counter() - start
+        self.baseline += baseline
+        return satisfied
+
+    def start_post(self):
+        self._post_start = (self.waited, self.baseline)
+
+    def end_post(self):
+        waited, baseline = self._post_start
+        self.post_saved.append((self.baseline - baseline) - (self.waited - waited))
+
+    def report(self):
+        if self.post_saved:
+            n = len(self.post_saved)
+            saved = sum(self.post_saved)
+            print(f"[INFO] Waits: {saved/n:.2f}s saved per post ({n} posts, {saved:.1f}s in total)")
+        print(f"[INFO] Waits: waited {self.waited:.1f}s / fixed sleep would be {self.baseline:.1f}s")
+
+    def _check(self, condition: Callable) -> bool:
+        try:
+            return bool(condition(self.driver))
+        except WebDriverException:
+            return False
@@ -1,12 +1,87 @@
+import time
+import json
+import pickle
+import shutil
 from tqdm import tqdm
+from itertools import islice
 from pathlib import Path
-from typing import Union
-from urllib.request import urlopen
-from .database import Database
-from .insta import Instagram
+from typing import Union, Callable, Tuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from .database import Database, DatabaseWriter
+from .sharding import ShardedDatabase, open_database
+from .insta import Instagram, InstagramPool
 from .utils import load_settings
+from .journal import Journal
+from .manifest import Manifest
+from .archive import TarShardWriter, next_shard_prefix, remove_shards, remove_samples
+from .packed import pack_images
+from .tensors import build_tensor_cache
+from .imaging import Transcoder
+
+def extract_post(db: Union[Database, ShardedDatabase], tag_path: Path, row: tuple, img_fmt: str) -> int:
+    r"""write `info.txt` and the images of a post(row of `Database.get_posts`). Returns bytes of the images"""
+    idx, postlink, uid, post, hashtags, date, likes = row
+    id_path = tag_path / f"{idx}"
+    id_path.mkdir(parents=True, exist_ok=True)
+    # info.txt: be aware of having no hashtags
+    with (id_path / "info.txt").open("w", encoding="utf-8") as file:
+        print("\t".join([str(uid), date, str(likes), postlink, post, hashtags]), 
+            file=file)
+    n_bytes = 0
+    # images are copied in chunks, a post is never held in memory
+    for i, (_, copy) in enumerate(db.iter_post_images(idx), 1):
+        with (id_path / f"{i}{img_fmt}").open("wb") as img_writer:
+            n_bytes += copy(img_writer)
+    return n_bytes
+
+def archive_post(db: Union[Database, ShardedDatabase], writer: TarShardWriter, tag: str, row: tuple, img_fmt: str) -> int:
+    r"""write a post(row of `Database.get_posts`) as `{id}.json` and `{id}.{i}{img_fmt}` members of a tar shard.
+    Returns bytes of the images"""
+    idx, postlink, uid, post, hashtags, date, likes = row
+    writer.next_sample()
+    info = {"id": idx, "tag": tag, "postlink": postlink, "uid": uid, "post": post,
+        "hashtags": hashtags, "date": date, "likes": likes}
+    writer.add(f"{idx}.json", json.dumps(info, ensure_ascii=False).encode("utf-8"))
+    n_bytes = 0
+    for i, (size, copy) in enumerate(db.iter_post_images(idx), 1):
+        writer.add_stream(f"{idx}.{i}{img_fmt}", size, copy)
+        n_bytes += size
+    return n_bytes
+
+# state of an extract worker process
+_extract_worker = {}
+
+def _init_extract_worker(conf_db: dict, output_path: str, img_fmt: str, shard_size: int):
+    _extract_worker["db"] = open_database(**{**conf_db, "read_only": True})
+    _extract_worker["output_path"] = Path(output_path)
+    _extract_worker["img_fmt"] = img_fmt
+    _extract_worker["shard_size"] = shard_size
+
+def _extract_chunk(tag: str, ids: list, prefix: Union[str, None]=None) -> Tuple[int, int]:
+    r"""extract the posts of sorted `ids` of the tag, rows are streamed from the id range.
+    Into the tar shards of `prefix` when given. Returns (posts, bytes)"""
+    db = _extract_worker["db"]
+    tag_path = _extract_worker["output_path"] / tag
+    img_fmt = _extract_worker["img_fmt"]
+    writer = None if prefix is None else TarShardWriter(tag_path, prefix, _extract_worker["shard_size"])
+    wanted = set(ids)
+    n_posts, n_bytes = 0, 0
+    for row in db.get_posts(tag, (ids[0], ids[-1])):
+        if row[0] in wanted:
+            if writer is None:
+                n_bytes += extract_post(db, tag_path, row, img_fmt)
+            else:
+                n_bytes += archive_post(db, writer, tag, row, img_fmt)
+            n_posts += 1
+    if writer is not None:
+        writer.close()
+    return n_posts, n_bytes
 
 class Spider:
+    JOURNAL_NAME = "journal.txt"
+    # a manifest per tag and extract format
+    MANIFEST_NAME = "{}_{}_manifest.txt"
+
     def __init__(self, settings_path: str):
         self.check_path(settings_path, "file")
         conf = load_settings(settings_path)
@@ -15,12 +90,15 @@ class Spider:
         self.conf_db = conf["db_settings"]
         self.conf_spider = conf["spider_settings"]
 
-        self.db = Database(**self.conf_db)
+        self.db = open_database(**self.conf_db)
         if self.conf_spider["recreate"]:
             self.db.recreate()
 
         if not self.conf_spider["only_extract"]:
-            self.insta = Instagram(**self.conf_insta)
+            if self.conf_insta.get("pool_size", 1) > 1:
+                self.insta = InstagramPool(**self.conf_insta)
+            else:
+                self.insta = Instagram(**self.conf_insta)
         self.stage = self.conf_spider["stage"]
         self.img_fmt = self.conf_spider["img_fmt"]
 
@@ -56,33 +134,182 @@ class Spider:
                 print(l, file=file)
 
     def _run_get_data(self, tag: str, tag_path: Path):
+        links = self._read_links(tag_path)
+
+        # resume: skip the posts already in database and the failed posts in journal
+        journal = Journal(tag_path / self.JOURNAL_NAME)
+        ingested = self.db.get_postlinks(tag)
+        retry_failed = self.conf_spider.get("retry_failed", False)
+        remains = [l for l in links if l not in ingested and (retry_failed or not journal.is_failed(l))]
+        if len(remains) < len(links):
+            print(f"[INFO] Resume: {len(links)-len(remains)} links skipped, {len(remains)} links remain")
+
+        try:
+            self._ingest([(tag, l) for l in remains], {tag: journal})
+        finally:
+            journal.close()
+
+    def _read_links(self, tag_path: Path) -> list:
         with (tag_path / "links.txt").open("r", encoding="utf-8") as file:
             links = [x.strip() for x in file.readlines()]
-        
-        table_idx = self.db.get_last_id()
-        table_idx = table_idx[0][0] if table_idx else 0
+        return links
 
-        pbar = tqdm(enumerate(self.insta.get_data(links), 1),
-            desc="Getting data", total=len(links))
+    def _ingest(self, items: list, journals: dict, shared: Union[dict, None]=None):
+        """scrape the posts and insert into database
 
-        batch = []
+        Args:
+            items (list): (tag, postlink) pairs, postlinks should be unique
+            journals (dict): journal of each tag
+            shared (Union[dict, None], optional): postlink: other tags that the post also appeared under,
+                the post will be linked to the tags after inserted. Defaults to None.
+        """
+        shared = shared or {}
+        tag_of = {l: tag for tag, l in items}
+        committed = []
+
+        def on_skip(link: str):
+            for tag in [tag_of[link]] + shared.get(link, []):
+                journals[tag].fail(link)
+
+        def on_commit(batch: list):
+            for x in batch:
+                for tag in [x[1]] + shared.get(x[2], []):
+                    journals[tag].done([x[2]])
+                committed.append(x[2])
+
+        # ids are assigned by database, other spider processes can ingest into the same database
+        links = [l for _, l in items]
+        rows = self.insta.get_data(links, on_skip=on_skip)
+        transcoder = self.get_transcoder()
+        if transcoder is not None:
+            # images are transcoded in processes while scraping goes on
+            rows = transcoder.map_rows(rows, img_idx=2)
+        pbar = tqdm(rows, desc="Getting data", total=len(links))
+
+        try:
+            self._write_rows(pbar, tag_of, on_commit)
+        finally:
+            if transcoder is not None:
+                transcoder.close()
+        if transcoder is not None:
+            transcoder.report()
+        if shared:
+            self.db.link_tags([(tag, l) for l in committed for tag in shared.get(l, [])])
+            self.db.commit()
+
+    def _write_rows(self, pbar: tqdm, tag_of: dict, on_commit: Callable):
         freq = self.conf_spider["insert_freq"]
-        for i, x in pbar:
-            batch.append([table_idx+i, tag] + x)
+        if self.conf_spider.get("pipeline", False):
+            # scraper pushes rows, writer thread inserts and commits
+            writer = DatabaseWriter(self.conf_db, max_rows=freq,
+                max_bytes=self.conf_spider.get("insert_bytes", 32) * 2**20,
+                commit_interval=self.conf_spider.get("commit_interval", 10.0),
+                queue_size=self.conf_spider.get("queue_size", 100),
+                on_commit=on_commit
+            )
+            writer.start()
+            try:
+                for x in pbar:
+                    writer.put([None, tag_of[x[0]]] + x)
+            finally:
+                writer.close()
+        else:
+            batch = []
+            for x in pbar:
+                batch.append([None, tag_of[x[0]]] + x)
 
-            if len(batch) == freq:
-                pbar.set_description("Inserting data")
-                self.db.insert(batch)
-                self.db.commit()
-                batch = []
-                pbar.set_description("Getting data")
+                if len(batch) == freq:
+                    pbar.set_description("Inserting data")
+                    self.insert_batch(batch, on_commit)
+                    batch = []
+                    pbar.set_description("Getting data")
+
+            # insert remaining data
+            self.insert_batch(batch, on_commit)
+
+    def get_transcoder(self) -> Union[Transcoder, None]:
+        r"""transcode policy of `spider_settings`, None when `transcode_format` is not set"""
+        fmt = self.conf_spider.get("transcode_format")
+        if not fmt:
+            return None
+        return Transcoder(fmt, quality=self.conf_spider.get("transcode_quality", 80),
+            max_size=self.conf_spider.get("transcode_max_size"),
+            keep_original=self.conf_spider.get("transcode_keep_original", False),
+            workers=self.conf_spider.get("transcode_workers", 2))
 
-        # insert remaining data
-        self.db.insert(batch)
-        self.db.commit()
+    def insert_batch(self, batch: list, on_commit: Callable):
+        self.db.ingest(batch)
+        on_commit(batch)
+
+    def run_scheduled(self, tags: list, stage=0):
+        """Run the scripts for multiple tags together. Links are collected concurrently(one driver per tag),
+        posts are scraped in round-robin order of the tags. A post appeared under several tags
+        is scraped once and linked to every tag.
+
+        Args:
+            tags (list): hashtags to search
+            stage (int, optional): run mode. Defaults to 0.
+                0: run all 
+                1: run only `get_links` 
+                2: run only `get_data`, from exists links file 
+        """
+        if stage not in (0, 1, 2):
+            raise Exception("[Error] Should insert `stage`")
+        tag_paths = {tag: self.output_path / tag for tag in tags}
+        for tag_path in tag_paths.values():
+            self.check_path(tag_path, "dir")
+        if stage in (0, 1):
+            n_workers = self.insta.pool_size if isinstance(self.insta, InstagramPool) else 1
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                list(executor.map(lambda tag: self._run_get_links(tag, tag_paths[tag]), tags))
+        if stage in (0, 2):
+            self._run_get_data_scheduled(tags, tag_paths)
+
+    def _run_get_data_scheduled(self, tags: list, tag_paths: dict):
+        thres_links = self.conf_insta["thres_links"]
+        retry_failed = self.conf_spider.get("retry_failed", False)
+        journals = {tag: Journal(tag_paths[tag] / self.JOURNAL_NAME) for tag in tags}
+        links = {tag: self._read_links(tag_paths[tag])[:thres_links] for tag in tags}
+        ingested = {tag: self.db.get_postlinks(tag) for tag in tags}
+        # global seen postlinks of all tags
+        stored = self.db.get_postlinks()
+
+        items = []  # (tag, postlink) to scrape
+        first_tag = {}  # postlink: tag that scrapes the post
+        shared = {}  # postlink: other tags
+        to_link = []  # (tag, postlink) already stored under other tag
+        for pos in range(max([len(x) for x in links.values()] + [0])):
+            for tag in tags:
+                if pos >= len(links[tag]):
+                    continue
+                link = links[tag][pos]
+                if link in ingested[tag] or (not retry_failed and journals[tag].is_failed(link)):
+                    continue
+                if link in stored:
+                    to_link.append((tag, link))
+                elif link in first_tag:
+                    shared.setdefault(link, []).append(tag)
+                else:
+                    first_tag[link] = tag
+                    items.append((tag, link))
+
+        print(f"[INFO] Schedule: {len(items)} posts to scrape, {len(shared)} shared by tags, {len(to_link)} linked to stored posts")
+        try:
+            if to_link:
+                self.db.link_tags(to_link)
+                self.db.commit()
+                for tag, link in to_link:
+                    journals[tag].done([link])
+            self._ingest(items, journals, shared)
+        finally:
+            for journal in journals.values():
+                journal.close()
 
     def main(self, tags: Union[list, str]):
-        if isinstance(tags, list):
+        if isinstance(tags, list) and len(tags) > 1 and self.conf_spider.get("schedule_tags", False):
+            print(f"[INFO] Search tags: {tags}")
+            self.run_scheduled(tags, self.stage)
+        elif isinstance(tags, list):
             for tag in tags:
                 print(f"[INFO] Search tag: {tag}")
                 self.run(tag, self.stage)
@@ -104,48 +331,261 @@ class Spider:
         if typ == "file" and not path.exists():
             raise Exception(f"file {path} not exists.")
 
-    def extract(self, tags=None):
-        self.db = Database(**self.conf_db)
-        c = self.db.get_cursor()
+    def extract(self, tags=None, query: Union[str, None]=None, incremental: Union[bool, None]=None,
+            prune: Union[bool, None]=None, fmt: Union[str, None]=None):
+        r"""extract the posts into `output_path`. With `extract_workers` > 1 of `spider_settings`,
+        the ids of the tags are split into chunks of `extract_chunk` posts and extracted by worker processes,
+        each worker streams its chunks with an own read-only connection.
+
+        Incremental extract keeps a manifest(`{output_path}/{tag}_{fmt}_manifest.txt`, see `Manifest`) of the extracted
+        posts and their digests, only new and changed posts are written, deleted posts are removed with `prune`.
+
+        With `fmt` "tar" the posts are streamed into tar shards(`{output_path}/{tag}/{part}-{n:06d}.tar`, see
+        `TarShardWriter`) of `archive_shard_size` MB instead of a folder per post, every worker
+        writes its own parts. A full extract replaces the parts of the tag, incremental runs remove the changed(and pruned)
+        posts from their shards(`remove_samples`) and append new parts with the new and changed posts.
+
+        Args:
+            tags (optional): tag or list of tags, all tags when None. Defaults to None.
+            query (Union[str, None], optional): full-text search query(see `Database.search_posts`),
+                only the matched posts are extracted. Defaults to None.
+            incremental (Union[bool, None], optional): `extract_incremental` of `spider_settings` when None.
+            prune (Union[bool, None], optional): remove the posts deleted from database(incremental only),
+                `extract_prune` of `spider_settings` when None.
+            fmt (Union[str, None], optional): "dir" or "tar", `extract_format` of `spider_settings` when None.
+        """
+        if incremental is None:
+            incremental = self.conf_spider.get("extract_incremental", False)
+        if prune is None:
+            prune = self.conf_spider.get("extract_prune", False)
+        fmt = fmt or self.conf_spider.get("extract_format", "dir")
+        if fmt not in ("dir", "tar"):
+            raise Exception(f"[Error] Unknown extract format: {fmt}, should be `dir` or `tar`")
+        self.db = open_database(**self.conf_db)
         # get all tags
         if tags is None:
-            sql = f"""SELECT DISTINCT tag FROM {self.db.table_name}"""
-            res = c.execute(sql).fetchall()
-            tags = list(map(lambda x: x[0], res))
+            tags = self.db.get_tags()
         elif isinstance(tags, str):
             tags = [tags]
-        pbar = tqdm()
 
+        # ids to extract of every tag, None for all posts of the tag
+        plans, manifests = {}, {}
         for tag in tags:
+            self.check_path(self.output_path / tag, "dir")
+            ids = None if query is None else sorted(self.db.search(query, tag=tag))
+            # a full extract(or the first incremental one) rewrites every post and replaces the parts,
+            # loaders would read the posts twice
+            if fmt == "tar" and not (incremental and (self.output_path / self.MANIFEST_NAME.format(tag, fmt)).exists()):
+                remove_shards(self.output_path / tag)
+            if incremental:
+                ids, manifests[tag] = self._plan_incremental(tag, ids, prune, fmt)
+            plans[tag] = ids
+
+        workers = self.conf_spider.get("extract_workers", 1)
+        if workers > 1:
+            self._extract_parallel(plans, workers, fmt)
+        else:
+            self._extract_serial(plans, fmt)
+        for manifest in manifests.values():
+            manifest.save()
+        self.db.close()
+        print("[INFO] Extract Done!")
+
+    def _plan_incremental(self, tag: str, ids: Union[list, None], prune: bool, fmt: str) -> Tuple[list, Manifest]:
+        r"""compare the tag with its manifest, remove the changed(and pruned) posts from output. 
+        Returns the ids to extract and the updated manifest, which is saved after extracting."""
+        tag_path = self.output_path / tag
+        manifest = Manifest(self.output_path / self.MANIFEST_NAME.format(tag, fmt))
+        digests = dict(self.db.get_posts_digest(tag))
+        new, changed, deleted = manifest.plan(digests, ids)
+        # changed posts are rewritten from scratch, they may have less images
+        stale = changed + (deleted if prune else [])
+        if fmt == "tar":
+            remove_samples(tag_path, {str(idx) for idx in stale})
+        else:
+            for idx in stale:
+                shutil.rmtree(tag_path / f"{idx}", ignore_errors=True)
+        print(f"[INFO] Extract {tag}: {len(new)} new / {len(changed)} changed / {len(deleted)} deleted"
+            f"{'(pruned)' if prune else ''} posts, {len(manifest.digests)} extracted before")
+        written = sorted(new + changed)
+        manifest.update(digests, written, deleted if prune else [])
+        return written, manifest
+
+    def _extract_serial(self, plans: dict, fmt: str):
+        shard_size = self.conf_spider.get("archive_shard_size", 512) * 2**20
+        pbar = tqdm()
+        for tag, ids in plans.items():
             pbar.set_description(f"[INFO] Extracting: {tag}")
-            
             tag_path = self.output_path / tag
-            self.check_path(tag_path, "dir")
 
-            sql = f"""SELECT id, postlink, uid, imgs, post, othertags, date, likes 
-                FROM {self.db.table_name} 
-                WHERE tag = '{tag}';"""
-            res = c.execute(sql).fetchall()
-
-            pbar.reset(total=len(res))
-            for idx, postlink, uid, imgs, post, hashtags, date, likes in res:
-                id_path = tag_path / f"{idx}"
-                self.check_path(id_path, "dir")
-                # info.txt: be aware of having no hashtags
-                with (id_path / "info.txt").open("w", encoding="utf-8") as file:
-                    print("\t".join([str(uid), date, str(likes), postlink, post, hashtags]), 
-                        file=file)
-                # images
-                # for i, img_url in enumerate(imgs.split("\t"), 1):
-                #     with urlopen(img_url) as img_reader:
-                #         with (id_path / f"{i}{self.img_fmt}").open("wb") as img_writer:
-                #             img = img_reader.read()
-                #             img_writer.write(img)
-                for i, img in enumerate(imgs.split(self.insta.IMG_SPLIT_TAG), 1):
-                    with (id_path / f"{i}{self.img_fmt}").open("wb") as img_writer:
-                        img_writer.write(img)
+            # include the posts linked to the tag, rows are streamed from the cursor
+            if ids is None:
+                posts = self.db.get_posts(tag)
+                pbar.reset(total=self.db.count_posts(tag))
+            elif not ids:
+                continue
+            else:
+                wanted = set(ids)
+                posts = filter(lambda x: x[0] in wanted, self.db.get_posts(tag, (ids[0], ids[-1])))
+                pbar.reset(total=len(ids))
+            if fmt == "tar":
+                writer = TarShardWriter(tag_path, next_shard_prefix(tag_path), shard_size)
+                for row in posts:
+                    archive_post(self.db, writer, tag, row, self.img_fmt)
+                    pbar.update(1)
+                writer.close()
+                continue
+            for row in posts:
+                extract_post(self.db, tag_path, row, self.img_fmt)
                 pbar.update(1)
-        c.close()
+        pbar.close()
+
+    def _extract_parallel(self, plans: dict, workers: int, fmt: str):
+        chunk = self.conf_spider.get("extract_chunk", 200)
+        shard_size = self.conf_spider.get("archive_shard_size", 512) * 2**20
+        tasks = []
+        for tag, ids in plans.items():
+            ids = self.db.get_ids(tag) if ids is None else ids
+            if fmt == "tar":
+                # a part of tar shards per worker, small chunks would leave small shards
+                part = int(next_shard_prefix(self.output_path / tag))
+                part_size = max(-(-len(ids) // workers), 1)
+                tasks.extend((tag, ids[i:i+part_size], f"{part + n:04d}")
+                    for n, i in enumerate(range(0, len(ids), part_size)))
+            else:
+                tasks.extend((tag, ids[i:i+chunk], None) for i in range(0, len(ids), chunk))
+        total = sum(len(ids) for _, ids, _ in tasks)
+        if not tasks:
+            return
+
+        pbar = tqdm(total=total, desc=f"[INFO] Extracting({workers} workers)")
+        n_bytes = 0
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_extract_worker,
+                initargs=(self.conf_db, str(self.output_path), self.img_fmt, shard_size)) as executor:
+            futures = [executor.submit(_extract_chunk, tag, ids, prefix) for tag, ids, prefix in tasks]
+            for future in as_completed(futures):
+                n_posts, chunk_bytes = future.result()
+                n_bytes += chunk_bytes
+                pbar.update(n_posts)
+                pbar.set_postfix_str(f"{n_bytes/2**20/(time.perf_counter()-start):.1f}MB/s")
+        pbar.close()
+        elapsed = time.perf_counter() - start
+        print(f"[INFO] Extract: {total} posts / {n_bytes/2**20:.1f}MB of images in {elapsed:.1f}s")
+
+    # columns of the parquet export, `tag` is the partition key.
+    # `uid` is the user name parsed from the post(`Instagram.parse_post_info`), numbers of old rows are written as text
+    PARQUET_COLUMNS = [
+        ("id", "int64"), ("postlink", "string"), ("post", "string"), ("othertags", "string"),
+        ("uid", "string"), ("date", "string"), ("likes", "int64"), ("n_imgs", "int32"), ("img_bytes", "int64")
+    ]
+
+    def export_parquet(self, tags=None, batch_size: Union[int, None]=None):
+        r"""export the post metadata(without images) into `{output_path}/parquet/tag={tag}/part-0.parquet`,
+        rows are streamed from database and written in row groups of `batch_size` rows.
+        Read with `pyarrow.dataset.dataset(path, partitioning="hive")` to get the `tag` column.
+        Requires `pyarrow`.
+
+        Args:
+            tags (optional): tag or list of tags, all tags when None. Defaults to None.
+            batch_size (Union[int, None], optional): rows of a row group, `parquet_batch` of `spider_settings` when None.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception("[Error] Parquet export requires `pyarrow`, run `pip install pyarrow`")
+        batch_size = batch_size or self.conf_spider.get("parquet_batch", 10000)
+        schema = pa.schema([(name, getattr(pa, typ)()) for name, typ in self.PARQUET_COLUMNS])
+
+        self.db = open_database(**self.conf_db)
+        if tags is None:
+            tags = self.db.get_tags()
+        elif isinstance(tags, str):
+            tags = [tags]
+        pbar = tqdm()
+
+        for tag in tags:
+            pbar.set_description(f"[INFO] Exporting: {tag}")
+            pbar.reset(total=self.db.count_posts(tag))
+            tag_path = self.output_path / "parquet" / f"tag={tag}"
+            self.check_path(tag_path, "dir")
+            rows = self.db.get_posts_meta(tag)
+            with pq.ParquetWriter(tag_path / "part-0.parquet", schema) as writer:
+                while True:
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+                    columns = [[None if x is None else str(x) for x in col] if field.type == pa.string() else col
+                        for col, field in zip(zip(*batch), schema)]
+                    writer.write_table(pa.Table.from_arrays(
+                        [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema))
+                    pbar.update(len(batch))
         self.db.close()
-        print("[INFO] Extract Done!")
+        print("[INFO] Export Done!")
+
+    def export_packed(self, tags=None, name: str="images") -> Path:
+        r"""pack the images of the posts into `{output_path}/packed/{name}.bin` with an index `{name}.idx.npy`,
+        read with `PackedDataset`. Exporting again(or other tags) appends the posts not packed yet. Requires `numpy`.
+
+        Args:
+            tags (optional): tag or list of tags, all tags when None. Defaults to None.
+            name (str, optional): dataset name. Defaults to "images".
+
+        Returns:
+            Path: dataset path without suffix
+        """
+        self.db = open_database(**self.conf_db)
+        if tags is None:
+            tags = self.db.get_tags()
+        elif isinstance(tags, str):
+            tags = [tags]
+        post_ids = set()
+        for tag in tags:
+            post_ids.update(self.db.get_ids(tag))
+        path = self.output_path / "packed" / name
+        self.check_path(path.parent, "dir")
+        start = time.perf_counter()
+        n_images = pack_images(self.db, path, post_ids)
+        self.db.close()
+        print(f"[INFO] Packed {n_images} images of {len(tags)} tags in {time.perf_counter()-start:.1f}s")
+        return path
+
+    # label container of `Labeler`
+    TAG_CONTAINER_NAME = "{}_tag_container.pickle"
+
+    def export_tensors(self, tags=None, size: Union[int, None]=None, workers: Union[int, None]=None) -> list:
+        r"""decode and resize the images of every tag once into `{output_path}/tensors/{tag}`(see `build_tensor_cache`),
+        labels are joined from the label container of `Labeler`. Exporting again only decodes the new posts.
+        Read with `TensorCache`. Requires `numpy`.
+
+        Args:
+            tags (optional): tag or list of tags, all tags when None. Defaults to None.
+            size (Union[int, None], optional): width and height, `tensor_size` of `spider_settings` when None.
+            workers (Union[int, None], optional): decode processes, `tensor_workers` of `spider_settings` when None.
+
+        Returns:
+            list: paths of the caches
+        """
+        size = size or self.conf_spider.get("tensor_size", 224)
+        workers = workers or self.conf_spider.get("tensor_workers", 4)
+        self.db = open_database(**self.conf_db)
+        if tags is None:
+            tags = self.db.get_tags()
+        elif isinstance(tags, str):
+            tags = [tags]
+        self.db.close()
+        paths = []
+        for tag in tags:
+            container_path = self.output_path / tag / self.TAG_CONTAINER_NAME.format(tag)
+            labels = {}
+            if container_path.exists():
+                with container_path.open("rb") as file:
+                    labels = pickle.load(file)
+            path = self.output_path / "tensors" / tag
+            stats = build_tensor_cache(self.conf_db, path, tag, labels, (size, size), workers)
+            print(f"[INFO] Tensors {tag}: {stats['new']} images decoded({stats['failed']} failed) "
+                f"in {stats['seconds']:.1f}s, {stats['images']} images, {len(labels)} labeled posts")
+            paths.append(path)
+        return paths
         
\ No newline at end of file